@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 from pathlib import Path
 
+import dj_database_url
 from django.urls import reverse_lazy
 from environs import Env
 
@@ -54,13 +55,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.middleware.MetricsMiddleware',
+    'store.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,6 +96,51 @@ DATABASES = {
     'default': env.dj_db_url('DATABASE_URL')
     }
 
+# Read replicas of the default database, as replica0, replica1, ...
+for index, url in enumerate(env.list('REPLICA_DATABASE_URLS', default=[])):
+    DATABASES[f'replica{index}'] = {
+        **dj_database_url.parse(url), 'TEST': {'MIRROR': 'default'}}
+
+STORE_REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+# How long a client that wrote something keeps reading from the primary
+STORE_REPLICA_PIN_SECONDS = env.int('STORE_REPLICA_PIN_SECONDS', default=5)
+
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', default='locmem://')
+    }
+
+# Off to have every list and detail response built from the database
+STORE_RESPONSE_CACHE = env.bool('STORE_RESPONSE_CACHE', default=True)
+STORE_CACHE_TIMEOUT = env.int('STORE_CACHE_TIMEOUT', default=300)
+STORE_CACHE_LOCK_TIMEOUT = env.int('STORE_CACHE_LOCK_TIMEOUT', default=10)
+STORE_USER_CACHE_TIMEOUT = env.int('STORE_USER_CACHE_TIMEOUT', default=300)
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+REST_FRAMEWORK = {
+    # Rates of the store.throttling write throttles, per user and per IP
+    # for every view's throttle_scope
+    'DEFAULT_THROTTLE_RATES': {
+        'relation_user': env.str(
+            'STORE_THROTTLE_RELATION_USER', default='120/min'),
+        'relation_ip': env.str(
+            'STORE_THROTTLE_RELATION_IP', default='600/min'),
+        'book_create_user': env.str(
+            'STORE_THROTTLE_BOOK_CREATE_USER', default='60/hour'),
+        'book_create_ip': env.str(
+            'STORE_THROTTLE_BOOK_CREATE_IP', default='300/hour'),
+    },
+    # Reverse proxies in front of the app, for the client IP of the
+    # per IP throttles
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=None),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -149,3 +197,39 @@ SOCIAL_AUTH_GITHUB_SECRET = env.str('SOCIAL_AUTH_GITHUB_SECRET')
 INTERNAL_IPS = [
         '127.0.0.1',
         ]
+
+# Store
+
+STORE_RELATION_BULK_MAX_ITEMS = 500
+
+# Acknowledge like/bookmark toggles right away and write them in batches
+STORE_RELATION_WRITE_BEHIND = env.bool(
+    'STORE_RELATION_WRITE_BEHIND', default=False)
+STORE_RELATION_FLUSH_INTERVAL = env.float(
+    'STORE_RELATION_FLUSH_INTERVAL', default=1.0)
+STORE_RELATION_FLUSH_MAX_PENDING = 1000
+STORE_RELATION_PENDING_TIMEOUT = 300
+
+STORE_EXPORT_CHUNK_SIZE = 2000
+
+STORE_IMPORT_BATCH_SIZE = env.int('STORE_IMPORT_BATCH_SIZE', default=1000)
+# Row errors kept in an import result, the rest are only counted
+STORE_IMPORT_MAX_ERRORS = 100
+
+STORE_RATING_MIN_VOTES = env.int('STORE_RATING_MIN_VOTES', default=10)
+# Catalog mean rating assumed until rebuild_rating_scores computes it
+STORE_RATING_PRIOR = 3.0
+
+# Bounds of the /book/facets/ price buckets and the authors it lists
+STORE_FACET_PRICE_BUCKETS = [10, 25, 50, 100]
+STORE_FACET_AUTHORS = 10
+
+# /book/<id>/similar/, see store.recommendations
+STORE_SIMILAR_BOOKS_PATH = env.str(
+    'STORE_SIMILAR_BOOKS_PATH', default=str(BASE_DIR / 'similar_books.npz'))
+STORE_SIMILAR_BOOKS_K = env.int('STORE_SIMILAR_BOOKS_K', default=20)
+# Ratings from this one up count as liking the book
+STORE_SIMILAR_MIN_RATE = 4
+
+STORE_READERS_PREVIEW = 3
+STORE_READERS_PREVIEW_MAX = 10
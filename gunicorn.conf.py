@@ -0,0 +1,27 @@
+import os
+import shutil
+
+# Workers share Prometheus metrics through this directory, see store.metrics
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/library-api-metrics')
+
+wsgi_app = 'books.wsgi:application'
+
+
+def on_starting(server):
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # Write the queued relation toggles, which only this worker sees when
+    # the cache is local
+    from store.writebehind import relation_buffer
+
+    relation_buffer.flush()
@@ -1,7 +1,13 @@
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin
 
-from store.models import Book, UserBookRelation
+from store.models import Author, Book, UserBookRelation
+
+
+@admin.register(Author)
+class AuthorAdmin(ModelAdmin):
+    list_display = ('name', 'books_count', 'rating')
+    search_fields = ('name',)
 
 
 @admin.register(Book)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from store import signals  # noqa: F401
+        from store.search import restore_sqlite_triggers
+
+        post_migrate.connect(restore_sqlite_triggers, sender=self)
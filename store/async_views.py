@@ -0,0 +1,202 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponseNotAllowed
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.exceptions import Throttled
+from rest_framework.request import Request
+
+from store.cache import bump_books_version
+from store.logic import counters_delta
+from store.logic import lock_user_relations
+from store.logic import relation_counters
+from store.logic import update_book_counters
+from store.models import Book
+from store.models import UserBookRelation
+from store.serializer import BookValuesSerializer
+from store.serializer import get_rating_histograms
+from store.serializer import get_readers_preview
+from store.serializer import get_readers_preview_size
+from store.serializer import UserBookRelationsSerializer
+from store.views import BookViewSet
+from store.views import UserBookRelationViewSet
+from store.writebehind import relation_buffer
+from store.writebehind import TOGGLE_FIELDS
+
+# Async twins of BookViewSet list/retrieve and of the relation PATCH for
+# ASGI deployments. Querysets are still built by BookViewSet's filter
+# backends (that never touches the database); rows are then read through
+# the async ORM so the worker is free while the database answers. The
+# relation PATCH writes in one transaction, which needs a thread.
+# Django 4.1's require_http_methods() can't wrap coroutines, hence the
+# explicit method checks.
+
+
+def get_book_view(request, action):
+    view = BookViewSet(action=action, format_kwarg=None, kwargs={})
+    view.request = Request(request)
+    return view
+
+
+def error_response(error):
+    # The response DRF's exception handler would build
+    detail = error.detail
+    if not isinstance(detail, (list, dict)):
+        detail = {'detail': detail}
+    return JsonResponse(detail, status=error.status_code, safe=False)
+
+
+async def serialize_books(view, rows):
+    context = view.get_serializer_context()
+    fields = BookValuesSerializer.get_requested_fields(view.request)
+    if 'readers' in fields:
+        context['readers_preview'] = await sync_to_async(get_readers_preview)(
+            [row['id'] for row in rows], get_readers_preview_size(context))
+    if 'rating_histogram' in fields:
+        context['rating_histograms'] = await sync_to_async(
+            get_rating_histograms)([row['id'] for row in rows])
+    return BookValuesSerializer(rows, many=True, context=context).data
+
+
+async def book_list(request):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    view = get_book_view(request, 'list')
+    paginator = view.paginator
+    try:
+        queryset = view.filter_queryset(view.get_queryset())
+        page_queryset = paginator.get_page_queryset(
+            queryset, view.request, view)
+    except APIException as error:
+        return error_response(error)
+    page = paginator.set_page([row async for row in page_queryset.aiterator()])
+
+    return JsonResponse({
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+        'results': await serialize_books(view, page),
+    })
+
+
+async def book_detail(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    view = get_book_view(request, 'retrieve')
+    try:
+        queryset = view.get_queryset()
+    except APIException as error:
+        return error_response(error)
+    row = await queryset.filter(pk=pk).afirst()
+    if row is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    data = await serialize_books(view, [row])
+    return JsonResponse(data[0])
+
+
+@sync_to_async
+def get_authenticated_user(request):
+    return request.user if request.user.is_authenticated else None
+
+
+@sync_to_async
+def get_relation_throttle_wait(request, user):
+    # Seconds to wait by UserBookRelationViewSet's throttles, None if allowed
+    view = UserBookRelationViewSet(
+        action='partial_update', format_kwarg=None, kwargs={})
+    view.request = Request(request)
+    view.request.user = user
+    waits = [throttle.wait() for throttle in view.get_throttles()
+             if not throttle.allow_request(view.request, view)]
+    return max(waits) if waits else None
+
+
+@sync_to_async
+def get_relation_state(request, user, book_id):
+    # The relation with the queued toggles applied, see
+    # UserBookRelationViewSet.get_relation_state()
+    view = UserBookRelationViewSet(
+        action='retrieve', format_kwarg=None, kwargs={'book': book_id})
+    view.request = Request(request)
+    view.request.user = user
+    return view.get_relation_state()
+
+
+@sync_to_async
+def update_relation(user, book_id, fields):
+    # One transaction with the relation locked, as in the sync view. The
+    # update() skips the post_save signal, so counters and the cache
+    # version are handled here.
+    with transaction.atomic():
+        lock_user_relations(user)
+        relation, _ = UserBookRelation.objects.select_for_update(
+            ).get_or_create(user=user, book_id=book_id)
+        old = relation_counters(relation.like, relation.rate)
+        for field, value in fields.items():
+            setattr(relation, field, value)
+
+        if fields:
+            UserBookRelation.objects.filter(pk=relation.pk).update(**fields)
+            update_book_counters(book_id, **counters_delta(
+                old, relation_counters(relation.like, relation.rate)))
+            transaction.on_commit(bump_books_version)
+    return relation
+
+
+async def relation_update(request, book):
+    if request.method != 'PATCH':
+        return HttpResponseNotAllowed(['PATCH'])
+
+    user = await get_authenticated_user(request)
+    if user is None:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=403)
+
+    wait = await get_relation_throttle_wait(request, user)
+    if wait is not None:
+        error = Throttled(wait)
+        return JsonResponse({'detail': error.detail}, status=429,
+                            headers={'Retry-After': str(error.wait)})
+
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'detail': 'JSON parse error.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'detail': 'Expected an object.'}, status=400)
+
+    payload.pop('book', None)
+    serializer = UserBookRelationsSerializer(data=payload, partial=True)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    if not await Book.objects.filter(pk=book).aexists():
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    fields = serializer.validated_data
+    if not settings.STORE_RELATION_WRITE_BEHIND:
+        relation = await update_relation(user, book, fields)
+        return JsonResponse(UserBookRelationsSerializer(relation).data)
+
+    # As UserBookRelationViewSet.partial_update: toggles are queued,
+    # ratings written right away
+    toggles = {field: value for field, value in fields.items()
+               if field in TOGGLE_FIELDS}
+    written = {field: value for field, value in fields.items()
+               if field not in TOGGLE_FIELDS}
+    if written:
+        await update_relation(user, book, written)
+
+    state = await get_relation_state(request, user, book)
+    if not toggles:
+        return JsonResponse(state)
+
+    await sync_to_async(relation_buffer.add)(user.pk, book, toggles)
+    state.update(toggles)
+    return JsonResponse(state, status=202)
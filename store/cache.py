@@ -0,0 +1,132 @@
+import hashlib
+import time
+from datetime import datetime
+from datetime import timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import reads_replica
+
+BOOKS_VERSION_KEY = 'store:books:version'
+BOOKS_MODIFIED_KEY = 'store:books:modified'
+RATING_PRIOR_KEY = 'store:books:rating_prior'
+
+
+def get_books_version() -> int:
+    version = cache.get(BOOKS_VERSION_KEY)
+    if version is None:
+        # Seeded from the clock so that a version evicted from the cache
+        # never comes back lower than one already stored in an entry.
+        cache.add(BOOKS_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(BOOKS_VERSION_KEY)
+    return version
+
+
+def bump_books_version() -> None:
+    cache.set(BOOKS_MODIFIED_KEY, time.time(), timeout=None)
+    try:
+        cache.incr(BOOKS_VERSION_KEY)
+    except ValueError:
+        get_books_version()
+
+
+def get_books_last_modified() -> datetime:
+    modified = cache.get(BOOKS_MODIFIED_KEY)
+    if modified is None:
+        cache.add(BOOKS_MODIFIED_KEY, time.time(), timeout=None)
+        modified = cache.get(BOOKS_MODIFIED_KEY)
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+
+def get_rating_prior() -> float:
+    # Set by store.logic.rebuild_rating_scores
+    prior = cache.get(RATING_PRIOR_KEY)
+    return settings.STORE_RATING_PRIOR if prior is None else prior
+
+
+def set_rating_prior(prior: float) -> None:
+    cache.set(RATING_PRIOR_KEY, prior, timeout=None)
+
+
+def rating_histogram_key(book_id) -> str:
+    return f'store:book:{book_id}:rating_histogram'
+
+
+def invalidate_rating_histograms(book_ids) -> None:
+    cache.delete_many([rating_histogram_key(book_id) for book_id in book_ids])
+
+
+def user_cache_key(user_id) -> str:
+    return f'store:user:{user_id}'
+
+
+def get_cached_user(user_id, load):
+    """
+    Return the user cached under ``user_id``, or ``load()`` it and cache it
+    if it is authenticated. Entries are dropped when the user is saved,
+    deleted or logs out, see store.signals.
+    """
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = load()
+        if user.is_authenticated:
+            cache.set(key, user, timeout=settings.STORE_USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate_user_cache(user_id) -> None:
+    cache.delete(user_cache_key(user_id))
+
+
+def request_digest(request, *parts) -> str:
+    params = sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists())
+    # Replicas may lag behind the version an entry is stored under, so
+    # what they return is kept apart from what clients pinned to the
+    # primary are served
+    raw = repr((request.get_host(), reads_replica(), parts,
+                params)).encode()
+    return hashlib.md5(raw).hexdigest()
+
+
+def make_request_key(prefix: str, request, *parts) -> str:
+    return f'{prefix}:{request_digest(request, *parts)}'
+
+
+def get_or_build(key: str, build):
+    """
+    Return the value cached under ``key`` for the current books version,
+    calling ``build()`` at most once across workers when it is stale.
+    """
+    if not settings.STORE_RESPONSE_CACHE:
+        return build()
+
+    version = get_books_version()
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=settings.STORE_CACHE_LOCK_TIMEOUT):
+        try:
+            value = build()
+            cache.set(key, (version, value),
+                      timeout=settings.STORE_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # Somebody else is rebuilding: serve the stale copy if there is one,
+    # otherwise wait for the fresh one for as long as the lock may live.
+    if entry is not None:
+        return entry[1]
+
+    deadline = time.monotonic() + settings.STORE_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry[0] >= version:
+            return entry[1]
+    return build()
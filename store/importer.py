@@ -0,0 +1,88 @@
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_books_version
+from .logic import get_author_ids
+from .logic import rebuild_author_counters
+from .models import Book
+from .serializer import BooksSerializer
+
+
+def read_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(lines):
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError:
+            yield line_num, None
+
+
+# Readers take an iterable of text lines and yield (line number, row)
+IMPORT_FORMATS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+def import_books(rows, owner=None, batch_size: int | None = None,
+                 dry_run: bool = False, on_error=None) -> dict:
+    """
+    Validate ``(line number, row)`` pairs with the BooksSerializer rules and
+    insert the valid ones with bulk_create(), one transaction per batch.
+    Only the first STORE_IMPORT_MAX_ERRORS row errors are kept in the
+    result; ``on_error(line, errors)`` sees all of them.
+    """
+    batch_size = batch_size or settings.STORE_IMPORT_BATCH_SIZE
+    # One serializer validates every row, its fields are built only once
+    serializer = BooksSerializer()
+    result = {'created': 0, 'failed': 0, 'errors': [], 'dry_run': dry_run}
+    batch = []
+
+    def insert():
+        if not dry_run:
+            with transaction.atomic():
+                author_ids = get_author_ids(
+                    book.author_name for book in batch)
+                for book in batch:
+                    book.author_id = author_ids[book.author_name]
+                Book.objects.bulk_create(batch)
+                rebuild_author_counters(set(author_ids.values()))
+        result['created'] += len(batch)
+        batch.clear()
+
+    for line, row in rows:
+        if not isinstance(row, dict):
+            errors = {'non_field_errors': ['Expected an object.']}
+        else:
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as error:
+                errors = error.detail
+            else:
+                batch.append(Book(owner=owner, **data))
+                if len(batch) >= batch_size:
+                    insert()
+                continue
+
+        result['failed'] += 1
+        if len(result['errors']) < settings.STORE_IMPORT_MAX_ERRORS:
+            result['errors'].append({'line': line, 'errors': errors})
+        if on_error is not None:
+            on_error(line, errors)
+
+    if batch:
+        insert()
+    if result['created'] and not dry_run:
+        bump_books_version()
+    return result
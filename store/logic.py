@@ -1,3 +1,30 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.db.models import Avg
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models.functions import Cast
+from django.db.models.functions import Coalesce
+from django.db.models.functions import NullIf
+from django.utils import timezone
+
+from store.cache import bump_books_version
+from store.cache import get_rating_prior
+from store.cache import invalidate_rating_histograms
+from store.cache import set_rating_prior
+from store.models import Author
+from store.models import Book
+from store.models import UserBookRelation
 
 
 def operations(a: int, b: int, c: str) -> int | float | str:
@@ -12,3 +39,311 @@ def operations(a: int, b: int, c: str) -> int | float | str:
     else:
         return 'Operation unknown'
 
+
+NO_RELATION = {
+    'readers_count': 0,
+    'likes_count': 0,
+    'rating_sum': 0,
+    'rating_count': 0,
+}
+
+
+def relation_counters(like: bool, rate: int | None) -> dict[str, int]:
+    return {
+        'readers_count': 1,
+        'likes_count': int(bool(like)),
+        'rating_sum': rate or 0,
+        'rating_count': int(rate is not None),
+    }
+
+
+def counters_delta(old: dict[str, int], new: dict[str, int]) -> dict[str, int]:
+    return {key: new[key] - old[key] for key in new}
+
+
+def negate(counters: dict[str, int]) -> dict[str, int]:
+    return {key: -value for key, value in counters.items()}
+
+
+def rating_score_expression(rating_sum, rating_count, prior: float):
+    # Bayesian average: every book starts with STORE_RATING_MIN_VOTES votes
+    # of the catalog mean, so a couple of 5-star votes can't top a book
+    # rated 4.8 by hundreds. NULL while the book has no votes at all.
+    min_votes = settings.STORE_RATING_MIN_VOTES
+    return (Cast(rating_sum, FloatField()) + min_votes * prior) / (
+        NullIf(rating_count, 0) + min_votes)
+
+
+def counter_expressions(readers_count: int = 0, likes_count: int = 0,
+                        rating_sum: int = 0, rating_count: int = 0,
+                        prior: float | None = None) -> dict:
+    if prior is None:
+        prior = get_rating_prior()
+    new_sum = F('rating_sum') + rating_sum
+    new_count = F('rating_count') + rating_count
+    return {
+        'readers_count': F('readers_count') + readers_count,
+        'likes_count': F('likes_count') + likes_count,
+        'rating_sum': new_sum,
+        'rating_count': new_count,
+        'rating': Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+        'rating_score': rating_score_expression(new_sum, new_count, prior),
+        # Not Now(): SQLite's CURRENT_TIMESTAMP has whole seconds, and two
+        # writes in one second would keep the detail ETag
+        'updated_at': timezone.now(),
+    }
+
+
+def rating_changed(delta: dict[str, int]) -> bool:
+    # A single relation can't change its rate without moving one of these
+    return bool(delta.get('rating_sum') or delta.get('rating_count'))
+
+
+def author_rating_expressions(rating_sum: int = 0,
+                              rating_count: int = 0) -> dict:
+    new_sum = F('rating_sum') + rating_sum
+    new_count = F('rating_count') + rating_count
+    return {
+        'rating_sum': new_sum,
+        'rating_count': new_count,
+        'rating': Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+    }
+
+
+def update_book_counters(book_id: int, **delta: int) -> None:
+    if any(delta.values()):
+        Book.objects.filter(pk=book_id).update(**counter_expressions(**delta))
+    if rating_changed(delta):
+        Author.objects.filter(books=book_id).update(**author_rating_expressions(
+            delta.get('rating_sum', 0), delta.get('rating_count', 0)))
+        transaction.on_commit(
+            lambda: invalidate_rating_histograms([book_id]))
+
+
+def update_books_counters(deltas: dict[int, dict[str, int]]) -> None:
+    books = []
+    prior = get_rating_prior()
+    for book_id, delta in deltas.items():
+        if any(delta.values()):
+            book = Book(pk=book_id)
+            expressions = counter_expressions(prior=prior, **delta)
+            for field, expression in expressions.items():
+                setattr(book, field, expression)
+            books.append(book)
+
+    if books:
+        Book.objects.bulk_update(books, list(expressions))
+
+    rated = [book_id for book_id, delta in deltas.items()
+             if rating_changed(delta)]
+    if rated:
+        update_authors_ratings({book_id: deltas[book_id] for book_id in rated})
+        transaction.on_commit(lambda: invalidate_rating_histograms(rated))
+
+
+def update_authors_ratings(deltas: dict[int, dict[str, int]]) -> None:
+    # Rating deltas of books, summed per author
+    totals = {}
+    for book_id, author_id in Book.objects.filter(
+            pk__in=deltas, author__isnull=False).values_list(
+                'pk', 'author_id'):
+        total = totals.setdefault(author_id, {'rating_sum': 0,
+                                              'rating_count': 0})
+        for field in total:
+            total[field] += deltas[book_id].get(field, 0)
+
+    authors = []
+    for author_id, total in totals.items():
+        author = Author(pk=author_id)
+        expressions = author_rating_expressions(**total)
+        for field, expression in expressions.items():
+            setattr(author, field, expression)
+        authors.append(author)
+
+    if authors:
+        Author.objects.bulk_update(authors, list(expressions))
+
+
+def get_author_ids(names) -> dict[str, int]:
+    """
+    Map author names to Author ids, creating the authors that don't
+    exist yet.
+    """
+    names = set(names)
+    ids = dict(Author.objects.filter(name__in=names).values_list('name', 'pk'))
+    missing = names.difference(ids)
+    if missing:
+        Author.objects.bulk_create(
+            [Author(name=name) for name in missing], ignore_conflicts=True)
+        ids.update(Author.objects.filter(name__in=missing).values_list(
+            'name', 'pk'))
+    return ids
+
+
+def rebuild_author_counters(author_ids=None) -> int:
+    books = Book.objects.filter(
+        author=OuterRef('pk')).order_by().values('author')
+    books_count = books.annotate(c=Count('pk')).values('c')
+    rating_sum = books.annotate(s=Sum('rating_sum')).values('s')
+    rating_count = books.annotate(c=Sum('rating_count')).values('c')
+
+    authors = Author.objects.all()
+    if author_ids is not None:
+        authors = authors.filter(pk__in=author_ids)
+
+    rating_sum = Coalesce(Subquery(rating_sum), 0)
+    rating_count = Coalesce(Subquery(rating_count), 0)
+    return authors.update(
+        books_count=Coalesce(Subquery(books_count), 0),
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=Cast(rating_sum, FloatField()) / NullIf(rating_count, 0),
+    )
+
+
+def lock_user_relations(user) -> None:
+    """
+    Lock ``user`` until the end of the transaction. Rows that don't exist
+    yet can't be locked, so writers that may create relations of the user
+    take this lock first; otherwise two of them could both count the same
+    new relation from NO_RELATION.
+    """
+    # Without row locks (SQLite) writers are serialized anyway
+    if connections[router.db_for_write(User)].features.has_select_for_update:
+        list(User.objects.select_for_update().filter(
+            pk=user.pk).values_list('pk'))
+
+
+def bulk_upsert_relations(user, changes: dict[int, dict]) -> list:
+    """
+    Apply ``{book_id: {field: value}}`` changes of ``user``'s relations
+    with one INSERT ... ON CONFLICT and one counters UPDATE.
+    """
+    with transaction.atomic():
+        lock_user_relations(user)
+        existing = {
+            relation.book_id: relation for relation in
+            UserBookRelation.objects.select_for_update().filter(
+                user=user, book_id__in=changes)}
+
+        relations = []
+        deltas = {}
+        for book_id, fields in changes.items():
+            current = existing.get(book_id)
+            if current is None:
+                current = UserBookRelation(user=user, book_id=book_id)
+                old = NO_RELATION
+            else:
+                old = relation_counters(current.like, current.rate)
+
+            # Built without a pk so that every row goes through the single
+            # INSERT ... ON CONFLICT (user, book) statement below.
+            relation = UserBookRelation(
+                user=user, book_id=book_id, like=current.like,
+                in_bookmarks=current.in_bookmarks, rate=current.rate)
+            for field, value in fields.items():
+                setattr(relation, field, value)
+
+            deltas[book_id] = counters_delta(
+                old, relation_counters(relation.like, relation.rate))
+            relations.append(relation)
+
+        UserBookRelation.objects.bulk_create(
+            relations, update_conflicts=True,
+            unique_fields=['user', 'book'],
+            update_fields=['like', 'in_bookmarks', 'rate'])
+        update_books_counters(deltas)
+        transaction.on_commit(bump_books_version)
+
+    return relations
+
+
+def rebuild_book_counters(book_ids: list[int] | None = None) -> int:
+    relations = UserBookRelation.objects.filter(
+        book=OuterRef('pk')).order_by().values('book')
+
+    readers = relations.annotate(c=Count('pk')).values('c')
+    likes = relations.filter(like=True).annotate(c=Count('pk')).values('c')
+    rating_sum = relations.annotate(s=Sum('rate')).values('s')
+    rating_count = relations.annotate(c=Count('rate')).values('c')
+    rating = relations.annotate(a=Avg('rate')).values('a')
+
+    books = Book.objects.all()
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+
+    transaction.on_commit(lambda: invalidate_rating_histograms(
+        books.values_list('pk', flat=True)))
+
+    rating_sum = Coalesce(Subquery(rating_sum), 0)
+    rating_count = Coalesce(Subquery(rating_count), 0)
+    updated = books.update(
+        updated_at=timezone.now(),
+        readers_count=Coalesce(Subquery(readers), 0),
+        likes_count=Coalesce(Subquery(likes), 0),
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=Subquery(rating),
+        rating_score=rating_score_expression(
+            rating_sum, rating_count, get_rating_prior()),
+    )
+    rebuild_author_counters(
+        None if book_ids is None else books.values('author_id'))
+    return updated
+
+
+def rebuild_rating_scores() -> float:
+    """
+    Recompute the catalog mean rating used as the prior of every
+    ``rating_score`` and rescore all books with it.
+    """
+    totals = Book.objects.aggregate(
+        rating_sum=Sum('rating_sum'), rating_count=Sum('rating_count'))
+    prior = settings.STORE_RATING_PRIOR
+    if totals['rating_count']:
+        prior = totals['rating_sum'] / totals['rating_count']
+
+    with transaction.atomic():
+        Book.objects.update(rating_score=rating_score_expression(
+            F('rating_sum'), F('rating_count'), prior))
+        set_rating_prior(prior)
+        transaction.on_commit(bump_books_version)
+    return prior
+
+
+def price_buckets(bounds) -> list[dict]:
+    # Half-open [min, max) ranges between the sorted bounds, open-ended
+    # at both sides
+    edges = [None, *(f'{Decimal(bound):.2f}' for bound in sorted(bounds)),
+             None]
+    return [{'min': low, 'max': high} for low, high in zip(edges, edges[1:])]
+
+
+def book_facets(queryset) -> dict:
+    """
+    Count the books of a (filtered) queryset per price bucket of
+    STORE_FACET_PRICE_BUCKETS, in one conditional aggregation, and per
+    author for the STORE_FACET_AUTHORS most frequent authors.
+    """
+    queryset = queryset.select_related(None).prefetch_related(
+        None).order_by()
+    buckets = price_buckets(settings.STORE_FACET_PRICE_BUCKETS)
+
+    counts = {}
+    for index, bucket in enumerate(buckets):
+        lookups = {}
+        if bucket['min'] is not None:
+            lookups['price__gte'] = bucket['min']
+        if bucket['max'] is not None:
+            lookups['price__lt'] = bucket['max']
+        counts[f'bucket_{index}'] = Count('id', filter=Q(**lookups))
+    counts = queryset.aggregate(total=Count('id'), **counts)
+
+    authors = queryset.values('author_name').annotate(
+        count=Count('id')).order_by('-count', 'author_name')
+    return {
+        'count': counts['total'],
+        'price': [{**bucket, 'count': counts[f'bucket_{index}']}
+                  for index, bucket in enumerate(buckets)],
+        'authors': list(authors[:settings.STORE_FACET_AUTHORS]),
+    }
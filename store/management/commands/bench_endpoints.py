@@ -0,0 +1,171 @@
+import json
+import platform
+import random
+import statistics
+import time
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db import transaction
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from store.cache import bump_books_version
+from store.models import Book
+
+# (name, method, path template, payload factory) for every BookViewSet and
+# UserBookRelationViewSet action. Paths are formatted with the benchmark
+# fixtures: {hot} is the most read book, {tail} the least read one, {own}
+# a book of the bench user and {fresh} a book created for this request.
+CASES = (
+    ('book.list', 'get', '/book/', None),
+    ('book.list.ordering', 'get', '/book/?ordering=-price', None),
+    ('book.list.filter', 'get', '/book/?price=1500.00', None),
+    ('book.list.search', 'get', '/book/?search=river', None),
+    ('book.retrieve.hot', 'get', '/book/{hot}/', None),
+    ('book.retrieve.tail', 'get', '/book/{tail}/', None),
+    ('book.readers', 'get', '/book/{hot}/readers/', None),
+    ('book.export', 'get', '/book/export/?search=river', None),
+    ('book.create', 'post', '/book/', lambda rng, fixtures: {
+        'name': 'Bench book', 'price': '10.00', 'author_name': 'Bench'}),
+    ('book.update', 'put', '/book/{own}/', lambda rng, fixtures: {
+        'name': 'Bench book', 'price': f'{rng.randint(100, 9999) / 100:.2f}',
+        'author_name': 'Bench'}),
+    ('book.partial_update', 'patch', '/book/{own}/', lambda rng, fixtures: {
+        'price': f'{rng.randint(100, 9999) / 100:.2f}'}),
+    ('book.destroy', 'delete', '/book/{fresh}/', None),
+    ('book-relation.partial_update', 'patch', '/book-relation/{hot}/',
+     lambda rng, fixtures: {
+         'like': rng.random() < 0.5, 'rate': rng.randint(1, 5)}),
+    ('book-relation.bulk', 'post', '/book-relation/bulk/',
+     lambda rng, fixtures: [
+        {'book': book_id, 'like': rng.random() < 0.5}
+        for book_id in rng.sample(fixtures['book_ids'], 50)]),
+)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Seed the database at several scales with seed_store and report '
+            'p50/p95 latency and query count of every book and relation API '
+            'action as JSON. Seeded data is rolled back after each scale.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--relations', type=int, nargs='+',
+                            default=[10000, 100000, 1000000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warm', action='store_true',
+                            help='Keep the response cache between requests')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write JSON here, not stdout')
+
+    def handle(self, *args, **options):
+        report = {
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'warm': options['warm'],
+            'scales': [],
+        }
+
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for relations in options['relations']:
+                report['scales'].append(
+                    self.bench_scale(relations, options))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def bench_scale(self, relations, options):
+        users = max(relations // 20, 100)
+        books = max(relations // 10, 100)
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            call_command('seed_store', users=users, books=books,
+                         relations=relations, seed=options['seed'],
+                         stdout=StringIO())
+            seed_seconds = time.perf_counter() - started
+
+            user = User.objects.create(username='bench_staff', is_staff=True)
+            client = APIClient()
+            client.force_authenticate(user)
+            fixtures = {
+                'hot': Book.objects.order_by('-readers_count').first().pk,
+                'tail': Book.objects.order_by('readers_count', 'pk').first().pk,
+                'own': Book.objects.create(
+                    name='Bench book', price=10, author_name='Bench',
+                    owner=user).pk,
+            }
+            fixtures['book_ids'] = list(
+                Book.objects.values_list('pk', flat=True)[:5000])
+
+            results = [
+                self.bench_case(client, case, fixtures, rng, options)
+                for case in CASES]
+            transaction.set_rollback(True)
+
+        # Responses cached while seeded must not outlive the rollback
+        bump_books_version()
+        return {
+            'relations': relations,
+            'users': users,
+            'books': books,
+            'seed_seconds': round(seed_seconds, 2),
+            'results': results,
+        }
+
+    def bench_case(self, client, case, fixtures, rng, options):
+        name, method, path, payload = case
+        timings = []
+        queries = []
+        statuses = set()
+
+        for _ in range(options['repeat']):
+            if '{fresh}' in path:
+                fixtures['fresh'] = Book.objects.create(
+                    name='Bench book', price=10, author_name='Bench').pk
+            url = path.format(**fixtures)
+            kwargs = {}
+            if payload:
+                kwargs = {'data': payload(rng, fixtures), 'format': 'json'}
+            if not options['warm']:
+                bump_books_version()
+
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, **kwargs)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                timings.append(time.perf_counter() - started)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+
+        return {
+            'name': name,
+            'method': method.upper(),
+            'path': path,
+            'statuses': sorted(statuses),
+            'p50_ms': round(statistics.median(timings) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'queries': round(statistics.median(queries)),
+            'queries_max': max(queries),
+        }
@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Book
+from store.models import UserBookRelation
+from store.serializer import BooksSerializer
+from store.serializer import BookValuesSerializer
+from store.views import get_books_queryset
+
+
+class Command(BaseCommand):
+    help = ('Compare BooksSerializer with BookValuesSerializer on generated '
+            'books. Data is created in a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, nargs='+',
+                            default=[1000, 10000])
+        parser.add_argument('--readers', type=int, default=3,
+                            help='Readers per book')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for count in options['books']:
+            with transaction.atomic():
+                self.seed(count, options['readers'])
+                model = self.measure(options['repeat'], lambda: BooksSerializer(
+                    get_books_queryset(), many=True).data)
+                values = self.measure(
+                    options['repeat'], lambda: BookValuesSerializer(
+                        BookValuesSerializer.get_queryset(get_books_queryset()),
+                        many=True).data)
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'{count} books: BooksSerializer {model * 1000:.1f} ms, '
+                f'BookValuesSerializer {values * 1000:.1f} ms, '
+                f'speedup x{model / values:.1f}')
+
+    def seed(self, count, readers):
+        users = User.objects.bulk_create(
+            User(username=f'bench_user_{i}', first_name=f'First {i}',
+                 last_name=f'Last {i}')
+            for i in range(max(readers * 10, 1)))
+        owner = users[0]
+        books = Book.objects.bulk_create(
+            Book(name=f'Book {i}', price=random.randint(100, 99999) / 100,
+                 author_name=f'Author {i % 500}', owner=owner,
+                 likes_count=random.randint(0, 100),
+                 rating=random.randint(100, 500) / 100)
+            for i in range(count))
+        UserBookRelation.objects.bulk_create(
+            UserBookRelation(user=user, book=book, like=True)
+            for book in books for user in random.sample(users, readers))
+
+    def measure(self, repeat, serialize):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serialize()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
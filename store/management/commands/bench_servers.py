@@ -0,0 +1,105 @@
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+SERVERS = {
+    'wsgi': ('books.wsgi:application', '/book/', []),
+    'asgi': ('books.asgi:application', '/async/book/',
+             ['--worker-class', 'uvicorn.workers.UvicornWorker']),
+}
+
+
+class Command(BaseCommand):
+    help = ('Start gunicorn with sync (WSGI) and uvicorn (ASGI) workers in '
+            'turn and compare book list throughput at high concurrency. '
+            'Books are read from the configured database on every request: '
+            'the response cache only the sync views use is turned off, '
+            'otherwise WSGI would be measured serving cache hits.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=list(SERVERS),
+                            default=list(SERVERS))
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Threads per sync worker')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--query', default='page_size=20')
+
+    def handle(self, *args, **options):
+        for name in options['servers']:
+            app, path, extra = SERVERS[name]
+            if name == 'wsgi':
+                extra = extra + ['--threads', str(options['threads'])]
+            url = (f'http://127.0.0.1:{options["port"]}{path}'
+                   f'?{options["query"]}')
+
+            server = subprocess.Popen([
+                sys.executable, '-m', 'gunicorn', app,
+                '--bind', f'127.0.0.1:{options["port"]}',
+                '--workers', str(options['workers']),
+                '--log-level', 'warning', *extra,
+            ], env={**os.environ, 'STORE_RESPONSE_CACHE': 'false'})
+            try:
+                self.wait_ready(url)
+                latencies, errors, elapsed = self.hammer(
+                    url, options['concurrency'], options['duration'])
+            finally:
+                server.terminate()
+                server.wait()
+
+            if not latencies:
+                raise CommandError(f'{name}: every request failed')
+            latencies.sort()
+            self.stdout.write(
+                f'{name}: {len(latencies) / elapsed:.0f} req/s, '
+                f'p50 {statistics.median(latencies) * 1000:.1f} ms, '
+                f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms, '
+                f'{errors} errors')
+
+    def wait_ready(self, url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                requests.get(url, timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f'{url} did not come up in {timeout}s')
+
+    def hammer(self, url, concurrency, duration):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            nonlocal errors
+            session = requests.Session()
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = session.get(url, timeout=30).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                latency = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        errors += 1
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(client)
+        return latencies, errors, time.monotonic() - started
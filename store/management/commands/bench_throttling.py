@@ -0,0 +1,137 @@
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth import HASH_SESSION_KEY
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils.crypto import get_random_string
+from rest_framework.settings import api_settings
+
+from store.models import Book
+from store.throttling import WriteRateThrottle
+
+
+class Command(BaseCommand):
+    help = ('Start gunicorn and have bot users behind one IP toggle likes '
+            'on a book as fast as they can. Reports how many relation '
+            'writes reached the database against the limit of the '
+            'relation throttles. Bots and their book are deleted after.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--bots', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES['default']['BACKEND']
+        if options['workers'] > 1 and backend.endswith('LocMemCache'):
+            raise CommandError(
+                'Workers only share throttle counters through a shared '
+                'cache, set CACHE_URL to memcached or redis')
+
+        book = Book.objects.create(
+            name='Throttling bench', price=10, author_name='Bench')
+        bots = [User.objects.create(username=f'bench-bot-{index}')
+                for index in range(options['bots'])]
+        logins = [self.login(bot) for bot in bots]
+        url = (f'http://127.0.0.1:{options["port"]}'
+               f'/book-relation/{book.pk}/')
+
+        server = subprocess.Popen([
+            sys.executable, '-m', 'gunicorn', 'books.wsgi:application',
+            '--bind', f'127.0.0.1:{options["port"]}',
+            '--workers', str(options['workers']),
+            '--log-level', 'warning',
+        ])
+        try:
+            self.wait_ready(url)
+            statuses, elapsed = self.hammer(
+                url, logins, options['concurrency'], options['duration'])
+        finally:
+            server.terminate()
+            server.wait()
+            for cookies in logins:
+                SessionStore(cookies[settings.SESSION_COOKIE_NAME]).delete()
+            User.objects.filter(pk__in=[bot.pk for bot in bots]).delete()
+            book.delete()
+
+        # Most a sliding window lets through in `elapsed` seconds
+        limits = []
+        for scope, clients in (('relation_user', len(bots)),
+                               ('relation_ip', 1)):
+            rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+            if rate is not None:
+                count, period = WriteRateThrottle().parse_rate(rate)
+                limits.append(clients * count * (1 + elapsed / period))
+        writes = statuses[200] + statuses[202]
+        limit = min(limits) if limits else None
+
+        self.stdout.write(
+            f'{sum(statuses.values()) / elapsed:.0f} req/s, '
+            f'{writes / elapsed:.1f} writes/s, '
+            f'{statuses[429]} throttled, '
+            f'{sum(statuses.values()) - writes - statuses[429]} other')
+        if limit is not None:
+            self.stdout.write(
+                f'{writes} writes in {elapsed:.1f}s, limit {limit:.0f}: '
+                f'{"bounded" if writes <= limit else "EXCEEDED"}')
+
+    def login(self, user):
+        # Session and CSRF cookies of a logged in user
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = (
+            'django.contrib.auth.backends.ModelBackend')
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return {settings.SESSION_COOKIE_NAME: session.session_key,
+                settings.CSRF_COOKIE_NAME: get_random_string(32)}
+
+    def wait_ready(self, url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                requests.get(url, timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f'{url} did not come up in {timeout}s')
+
+    def hammer(self, url, logins, concurrency, duration):
+        statuses = Counter()
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def bot(index):
+            cookies = logins[index % len(logins)]
+            client = requests.Session()
+            client.cookies.update(cookies)
+            client.headers['X-CSRFToken'] = cookies[settings.CSRF_COOKIE_NAME]
+            like = True
+            while time.monotonic() < deadline:
+                try:
+                    status = client.patch(
+                        url, json={'like': like}, timeout=30).status_code
+                except requests.RequestException:
+                    status = None
+                like = not like
+                with lock:
+                    statuses[status] += 1
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for index in range(concurrency):
+                executor.submit(bot, index)
+        return statuses, time.monotonic() - started
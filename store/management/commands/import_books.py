@@ -0,0 +1,56 @@
+import json
+import sys
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from store.importer import import_books
+from store.importer import IMPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = ('Import books from a CSV (name,price,author_name header) or '
+            'JSON lines file, streamed and inserted in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, - for stdin')
+        parser.add_argument('--format', choices=list(IMPORT_FORMATS),
+                            help='Defaults to the file extension')
+        parser.add_argument('--owner', help='Username of the books owner')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate only, insert nothing')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or path.rpartition('.')[2]
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError(
+                f'Unknown format, use --format {"/".join(IMPORT_FORMATS)}')
+
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user {options["owner"]}')
+
+        def on_error(line, errors):
+            self.stderr.write(f'line {line}: {json.dumps(errors)}')
+
+        if path == '-':
+            file = nullcontext(sys.stdin)
+        else:
+            file = open(path, newline='', encoding='utf-8')
+        with file as lines:
+            result = import_books(
+                IMPORT_FORMATS[import_format](lines), owner=owner,
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'], on_error=on_error)
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result["created"]} books, {result["failed"]} rows '
+            f'failed'))
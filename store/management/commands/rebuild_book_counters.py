@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.logic import rebuild_book_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount likes and ratings of every book from UserBookRelation'
+
+    def handle(self, *args, **options):
+        updated = rebuild_book_counters()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters of {updated} books'))
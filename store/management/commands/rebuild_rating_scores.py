@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.logic import rebuild_rating_scores
+
+
+class Command(BaseCommand):
+    help = ('Recompute the catalog mean rating and the Bayesian rating_score '
+            'of every book. Meant to run periodically, e.g. from cron.')
+
+    def handle(self, *args, **options):
+        prior = rebuild_rating_scores()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rescored books with a mean rating of {prior:.3f}'))
@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.recommendations import build_similar_books
+from store.recommendations import refresh_similar_books
+from store.recommendations import SimilarBooks
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the "readers also liked" neighbours of every book into '
+            'STORE_SIMILAR_BOOKS_PATH. Workers pick up the new file on their '
+            'next /book/<id>/similar/ request.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='Only recompute the books whose likes or ratings changed '
+                 'since the last build, when there is one.')
+
+    def handle(self, *args, **options):
+        path = settings.STORE_SIMILAR_BOOKS_PATH
+        if options['refresh'] and os.path.exists(path):
+            similar, changed = refresh_similar_books(SimilarBooks.load(path))
+            if not changed:
+                self.stdout.write('No changes since the last build')
+                return
+            message = f'Refreshed {changed} changed books'
+        else:
+            similar = build_similar_books()
+            message = f'Built neighbours of {len(similar.book_ids)} books'
+
+        similar.save(path)
+        self.stdout.write(self.style.SUCCESS(f'{message} into {path}'))
@@ -0,0 +1,153 @@
+import itertools
+import math
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import Max
+
+from store.cache import bump_books_version
+from store.logic import get_author_ids
+from store.logic import rebuild_book_counters
+from store.models import Book
+from store.models import UserBookRelation
+
+TITLE_WORDS = (
+    'silent', 'river', 'shadow', 'garden', 'winter', 'empire', 'light',
+    'stone', 'night', 'ocean', 'forest', 'secret', 'glass', 'iron', 'crown',
+    'storm', 'memory', 'journey', 'city', 'fire', 'moon', 'house', 'war',
+    'peace', 'dream', 'road', 'king', 'island', 'mountain', 'letter',
+)
+# Shares of 1..5 star ratings: skewed towards the top like most review sites
+RATING_WEIGHTS = (4, 6, 15, 33, 42)
+
+
+def zipf_cum_weights(count, alpha):
+    total = 0
+    cum_weights = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** alpha
+        cum_weights.append(total)
+    return cum_weights
+
+
+def max_pk(model):
+    return model.objects.aggregate(pk=Max('pk'))['pk'] or 0
+
+
+class Command(BaseCommand):
+    help = ('Add generated users, books and relations with power-law book '
+            'popularity and user activity, inserted in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--relations', type=int, default=10000)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Zipf exponent of book popularity')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        users, books, relations = (
+            options['users'], options['books'], options['relations'])
+        if min(users, books) < 1 or relations < 0:
+            raise CommandError('--users and --books must be positive')
+        if relations > users * books // 2:
+            raise CommandError(
+                f'--relations must be at most half of users x books '
+                f'({users * books // 2})')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        user_ids = self.seed_users(users)
+        book_ids = self.seed_books(books, user_ids)
+        self.seed_relations(relations, user_ids, book_ids, options['alpha'])
+
+        rebuild_book_counters()
+        bump_books_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {users} users, {books} books and {relations} relations'))
+
+    def insert(self, model, objects):
+        for batch in iter(lambda: list(
+                itertools.islice(objects, self.batch_size)), []):
+            model.objects.bulk_create(batch)
+
+    def seed_users(self, count):
+        start = max_pk(User)
+        tag = '%08x' % self.rng.getrandbits(32)
+        self.insert(User, (
+            User(username=f'seed_{tag}_{i}', first_name=f'First {i}',
+                 last_name=f'Last {i}', password=UNUSABLE_PASSWORD_PREFIX)
+            for i in range(count)))
+        return list(User.objects.filter(pk__gt=start).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def seed_books(self, count, user_ids):
+        rng = self.rng
+        start = max_pk(Book)
+
+        # A few prolific authors and owners, and a long tail of others
+        authors = [f'Author {i}' for i in range(max(count // 5, 1))]
+        author_weights = zipf_cum_weights(len(authors), 1.0)
+        author_ids = {}
+        for offset in range(0, len(authors), self.batch_size):
+            author_ids.update(get_author_ids(
+                authors[offset:offset + self.batch_size]))
+        owners = user_ids[:max(len(user_ids) // 20, 1)]
+
+        def books():
+            for i in range(count):
+                title = ' '.join(rng.sample(TITLE_WORDS, rng.randint(1, 3)))
+                price = min(rng.lognormvariate(math.log(1500), 0.6), 99999)
+                author_name = rng.choices(
+                    authors, cum_weights=author_weights)[0]
+                yield Book(
+                    name=f'The {title.capitalize()} {i}',
+                    price=Decimal(price).quantize(Decimal('0.01')),
+                    author_name=author_name,
+                    author_id=author_ids[author_name],
+                    owner_id=rng.choice(owners))
+
+        self.insert(Book, books())
+        return list(Book.objects.filter(pk__gt=start).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def seed_relations(self, count, user_ids, book_ids, alpha):
+        rng = self.rng
+        # Popularity ranks are shuffled so they don't follow the ids
+        book_ids = rng.sample(book_ids, len(book_ids))
+        user_ids = rng.sample(user_ids, len(user_ids))
+        book_weights = zipf_cum_weights(len(book_ids), alpha)
+        user_weights = zipf_cum_weights(len(user_ids), 0.8)
+        quality = {book_id: rng.gauss(0, 0.8) for book_id in book_ids}
+
+        def relations():
+            seen = set()
+            while len(seen) < count:
+                size = min(self.batch_size, count - len(seen))
+                for user_id, book_id in zip(
+                        rng.choices(user_ids, cum_weights=user_weights, k=size),
+                        rng.choices(book_ids, cum_weights=book_weights, k=size)):
+                    if (user_id, book_id) in seen:
+                        continue
+                    seen.add((user_id, book_id))
+                    yield self.relation(user_id, book_id, quality[book_id])
+
+        self.insert(UserBookRelation, relations())
+
+    def relation(self, user_id, book_id, quality):
+        rng = self.rng
+        rate = None
+        if rng.random() < 0.35:
+            rate = rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+            rate = max(1, min(5, round(rate + quality)))
+        like = rng.random() < (0.6 if rate and rate >= 4 else 0.15)
+        return UserBookRelation(
+            user_id=user_id, book_id=book_id, like=like, rate=rate,
+            in_bookmarks=rng.random() < 0.1)
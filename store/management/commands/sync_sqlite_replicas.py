@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the default SQLite database over every SQLite replica in '
+            'REPLICA_DATABASE_URLS, to stand in for replication locally.')
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+
+        primary.ensure_connection()
+        for alias in settings.STORE_REPLICA_DATABASES:
+            replica = connections[alias]
+            if replica.vendor != 'sqlite':
+                self.stderr.write(f'Skipped {alias}: not SQLite')
+                continue
+
+            replica.close()
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(
+                f'Copied default to {alias}'))
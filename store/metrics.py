@@ -0,0 +1,38 @@
+import os
+
+from prometheus_client import CollectorRegistry
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import generate_latest
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import multiprocess
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every worker
+# writes its samples to mmapped files in that directory and the /metrics
+# view of any worker aggregates all of them.
+
+REQUEST_LATENCY = Histogram(
+    'store_request_latency_seconds',
+    'Request latency by resolved route',
+    ['route', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'store_request_queries',
+    'ORM queries per request by resolved route',
+    ['route', 'method'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+REQUEST_DB_TIME = Histogram(
+    'store_request_db_seconds',
+    'Time spent in the database per request by resolved route',
+    ['route', 'method'],
+)
+
+
+def render_metrics():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
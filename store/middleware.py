@@ -0,0 +1,127 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+from rest_framework.permissions import SAFE_METHODS
+
+from .cache import get_cached_user
+from .metrics import REQUEST_DB_TIME
+from .metrics import REQUEST_LATENCY
+from .metrics import REQUEST_QUERIES
+from .routers import replica_state
+from .routers import ReplicaState
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+REPLICA_PIN_COOKIE = 'store_primary'
+
+
+class QueryStats:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    # Records latency, query count and database time of every request,
+    # labelled with the URL name instead of the path to keep the number of
+    # series bounded. Queries are counted with execute_wrapper(), which
+    # works with DEBUG off, unlike connection.queries. Streaming responses
+    # are measured up to the moment the view returns them.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        latency = time.perf_counter() - started
+
+        match = request.resolver_match
+        route = match.view_name if match else 'unresolved'
+        method = request.method if request.method in METHODS else 'other'
+        REQUEST_LATENCY.labels(
+            route, method, response.status_code).observe(latency)
+        REQUEST_QUERIES.labels(route, method).observe(stats.count)
+        REQUEST_DB_TIME.labels(route, method).observe(stats.duration)
+        return response
+
+
+class ReplicaMiddleware:
+    # Lets views with use_read_replica = True read from the replicas on
+    # safe methods (see store.routers.ReplicaRouter). A request that wrote
+    # anything pins its client to the primary for STORE_REPLICA_PIN_SECONDS
+    # with a cookie, so that it reads its own writes despite replica lag.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = ReplicaState()
+        token = replica_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_state.reset(token)
+
+        if state.wrote:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1',
+                max_age=settings.STORE_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        replica_state.get().use_replica = (
+            request.method in SAFE_METHODS
+            and getattr(view_class, 'use_read_replica', False)
+            and REPLICA_PIN_COOKIE not in request.COOKIES)
+
+
+def get_user(request):
+    # django.contrib.auth.get_user() with the user read from the cache.
+    # A cached user is only taken while it still matches the session's
+    # auth hash; anything unusual is left to get_user() itself.
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    backend = session.get(auth.BACKEND_SESSION_KEY)
+    if user_id is None or backend not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    user = get_cached_user(user_id, lambda: auth.get_user(request))
+    if not user.is_authenticated:
+        return user
+
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+            session_hash, user.get_session_auth_hash())):
+        return auth.get_user(request)
+    user.backend = backend
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    # With the cached_db session engine, authenticated requests need no
+    # session or user queries once both are cached.
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:02
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    relations = UserBookRelation.objects.filter(
+        book=OuterRef('pk')).order_by().values('book')
+
+    Book.objects.update(
+        likes_count=Coalesce(Subquery(
+            relations.filter(like=True).annotate(c=Count('pk')).values('c')), 0),
+        rating_sum=Coalesce(Subquery(
+            relations.annotate(s=Sum('rate')).values('s')), 0),
+        rating_count=Coalesce(Subquery(
+            relations.annotate(c=Count('rate')).values('c')), 0),
+        rating=Subquery(relations.annotate(a=Avg('rate')).values('a')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_alter_userbookrelation_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from store.search import install_search_index
+from store.search import uninstall_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'id'], name='store_book_author_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('like', True)), fields=['book'], name='store_ubr_book_liked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('rate__isnull', False)), fields=['book', 'rate'], name='store_ubr_book_rated_idx'),
+        ),
+    ]
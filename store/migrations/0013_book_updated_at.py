@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_book_readers_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
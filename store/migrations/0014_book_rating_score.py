@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import Cast, NullIf
+
+
+def fill_rating_score(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+
+    totals = Book.objects.aggregate(
+        rating_sum=Sum('rating_sum'), rating_count=Sum('rating_count'))
+    prior = settings.STORE_RATING_PRIOR
+    if totals['rating_count']:
+        prior = totals['rating_sum'] / totals['rating_count']
+
+    min_votes = settings.STORE_RATING_MIN_VOTES
+    Book.objects.update(rating_score=(
+        Cast(F('rating_sum'), FloatField()) + min_votes * prior) / (
+            NullIf(F('rating_count'), 0) + min_votes))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_score',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['likes_count', 'id'], name='store_book_likes_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['rating_score', 'id'], name='store_book_rating_score_id_idx'),
+        ),
+        migrations.RunPython(fill_rating_score, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:41
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+import django.db.models.deletion
+
+
+def create_authors(apps, schema_editor):
+    Author = apps.get_model('store', 'Author')
+    Book = apps.get_model('store', 'Book')
+
+    # One author per distinct author_name
+    names = Book.objects.order_by().values_list(
+        'author_name', flat=True).distinct()
+    Author.objects.bulk_create(
+        (Author(name=name) for name in names.iterator()), batch_size=1000)
+    Book.objects.update(author=Subquery(Author.objects.filter(
+        name=OuterRef('author_name')).values('pk')[:1]))
+
+    books = Book.objects.filter(
+        author=OuterRef('pk')).order_by().values('author')
+    rating_sum = Coalesce(Subquery(
+        books.annotate(s=Sum('rating_sum')).values('s')), 0)
+    rating_count = Coalesce(Subquery(
+        books.annotate(c=Sum('rating_count')).values('c')), 0)
+    Author.objects.update(
+        books_count=Coalesce(Subquery(
+            books.annotate(c=Count('pk')).values('c')), 0),
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=Cast(rating_sum, FloatField()) / NullIf(rating_count, 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_relation_user_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('books_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating', models.DecimalField(decimal_places=2, max_digits=3, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['books_count', 'id'], name='store_author_books_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='store.author'),
+        ),
+        migrations.RunPython(create_authors, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,65 @@
 from django.db import models
 
 
+class Author(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+
+    # Denormalized from Book, see store.logic.rebuild_author_counters
+    books_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, null=True)
+
+    class Meta:
+        indexes = [
+            # ordering_fields of the /author/ endpoint, name has its own
+            models.Index(fields=['books_count', 'id'],
+                         name='store_author_books_id_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
 class Book(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=7, decimal_places=2)
     author_name = models.CharField(max_length=255)
+    # Follows author_name, which stays the field clients write, see
+    # store.signals.assign_author
+    author = models.ForeignKey(
+        Author, on_delete=models.PROTECT, null=True, related_name='books')
     owner = models.ForeignKey(
         to='auth.User', on_delete=models.SET_NULL, null=True, related_name='my_books')
     readers = models.ManyToManyField(
         to='auth.User', through='UserBookRelation', related_name='books')
 
+    # Denormalized from UserBookRelation, see store.logic.update_book_counters
+    readers_count = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, null=True)
+    # Bayesian average of the ratings, see store.logic.rating_score_expression
+    rating_score = models.FloatField(null=True)
+
+    # Also moved by counter updates, so it changes with likes and rating
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # filterset_fields and ordering_fields, with the id tiebreaker
+            # used by KeysetPagination
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'],
+                         name='store_book_author_name_id_idx'),
+            # most_liked and top_rated leaderboards
+            models.Index(fields=['likes_count', 'id'],
+                         name='store_book_likes_id_idx'),
+            models.Index(fields=['rating_score', 'id'],
+                         name='store_book_rating_score_id_idx'),
+        ]
+
     def __str__(self) -> str:
         return f'ID {self.pk}: {self.name}'
 
@@ -31,6 +81,21 @@ class UserBookRelation(models.Model):
 
     class Meta:
         unique_together = ('user', 'book')
+        indexes = [
+            # rebuild_book_counters aggregation paths
+            models.Index(fields=['book'], condition=models.Q(like=True),
+                         name='store_ubr_book_liked_idx'),
+            models.Index(fields=['book', 'rate'],
+                         condition=models.Q(rate__isnull=False),
+                         name='store_ubr_book_rated_idx'),
+            # bookmarks and likes lists of a user
+            models.Index(fields=['user', 'book'],
+                         condition=models.Q(in_bookmarks=True),
+                         name='store_ubr_user_bookmarked_idx'),
+            models.Index(fields=['user', 'book'],
+                         condition=models.Q(like=True),
+                         name='store_ubr_user_liked_idx'),
+        ]
 
     def __str__(self):
         return f'{self.book.name} | User: {self.user.username} | RATING: {self.rate}'
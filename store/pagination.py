@@ -0,0 +1,135 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    # Keyset pagination over the queryset's own ordering (as left by
+    # OrderingFilter) with an id tiebreaker, so page depth costs no OFFSET.
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = [
+            term for term in queryset.query.order_by
+            if isinstance(term, str)] or [self.ordering]
+
+        keys = [term.lstrip('-') for term in ordering]
+        if 'id' not in keys and 'pk' not in keys:
+            descending = ordering[0].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        # Split from set_page() so that async views can fetch the rows
+        # of the page themselves.
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        # .values() rows need the ordering columns for the cursors
+        fields = queryset.query.values_select
+        missing = [term.lstrip('-') for term in self.ordering
+                   if fields and term.lstrip('-') not in fields]
+        if missing:
+            queryset = queryset.values(*fields, *missing)
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor is not None and self.cursor.position is not None:
+            try:
+                queryset = queryset.filter(
+                    self._get_keyset_filter(self._decode_position(), reverse))
+            except (TypeError, ValueError, ValidationError):
+                # Crafted positions the ordering fields can't take
+                raise NotFound(self.invalid_cursor_message)
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self.encode_cursor(Cursor(offset=0, reverse=False, position=None))
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for term in ordering:
+            field_name = term.lstrip('-')
+            if isinstance(instance, dict):
+                values.append(instance[field_name])
+            else:
+                values.append(getattr(instance, field_name))
+        return json.dumps(values, cls=DjangoJSONEncoder)
+
+    def _decode_position(self):
+        try:
+            values = json.loads(self.cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _get_keyset_filter(self, values, reverse):
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y)
+        keyset = Q()
+        equal = {}
+        for term, value in zip(self.ordering, values):
+            field_name = term.lstrip('-')
+            lookup = 'lt' if term.startswith('-') != reverse else 'gt'
+            keyset |= Q(**equal, **{f'{field_name}__{lookup}': value})
+            equal[field_name] = value
+        return keyset
+
+
+def _reverse_ordering(ordering):
+    return tuple(
+        term[1:] if term.startswith('-') else f'-{term}' for term in ordering)
@@ -0,0 +1,249 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from datetime import timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.db.models import Q
+from scipy import sparse
+
+from .models import Book
+from .models import UserBookRelation
+
+# "Readers also liked": item-item cosine similarity over the users who
+# liked or rated a book highly, top STORE_SIMILAR_BOOKS_K neighbours per
+# book. Built offline by the rebuild_similar_books command into an .npz
+# file that every worker loads once and serves /book/<id>/similar/ from.
+
+
+SIMILARITY_CHUNK_SIZE = 1000
+
+
+def positive_relations():
+    return UserBookRelation.objects.filter(
+        Q(like=True) | Q(rate__gte=settings.STORE_SIMILAR_MIN_RATE))
+
+
+def read_pairs(relations) -> np.ndarray:
+    # (user id, book id) rows, streamed straight into an array
+    rows = relations.order_by().values_list('user_id', 'book_id').iterator(
+        chunk_size=settings.STORE_EXPORT_CHUNK_SIZE)
+    pairs = np.fromiter((value for row in rows for value in row),
+                        dtype=np.int64)
+    return pairs.reshape(-1, 2)
+
+
+def top_neighbours(scores, book_ids, k):
+    # Best k of one sparse row, by score then by book id
+    order = np.lexsort((book_ids, -scores))[:k]
+    return book_ids[order], scores[order]
+
+
+class SimilarBooks:
+    """
+    Top neighbours of every book in CSR layout: the neighbours of
+    ``book_ids[i]`` are ``neighbours[indptr[i]:indptr[i + 1]]``, best first,
+    with their cosine similarity in ``scores``.
+    """
+
+    def __init__(self, book_ids, indptr, neighbours, scores, built_at):
+        self.book_ids = book_ids
+        self.indptr = indptr
+        self.neighbours = neighbours
+        self.scores = scores
+        self.built_at = built_at
+
+    @classmethod
+    def from_rows(cls, rows: dict, built_at: float) -> 'SimilarBooks':
+        book_ids = np.array(sorted(rows), dtype=np.int64)
+        sizes = [len(rows[book_id][0]) for book_id in book_ids]
+        indptr = np.zeros(len(book_ids) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=indptr[1:])
+        return cls(
+            book_ids, indptr,
+            np.concatenate([rows[book_id][0] for book_id in book_ids]
+                           or [np.empty(0, np.int64)]).astype(np.int64),
+            np.concatenate([rows[book_id][1] for book_id in book_ids]
+                           or [np.empty(0, np.float32)]).astype(np.float32),
+            built_at)
+
+    def to_rows(self) -> dict:
+        return {
+            int(book_id): (self.neighbours[start:end], self.scores[start:end])
+            for book_id, start, end in zip(
+                self.book_ids, self.indptr[:-1], self.indptr[1:])}
+
+    @classmethod
+    def load(cls, path) -> 'SimilarBooks':
+        with np.load(path) as data:
+            return cls(data['book_ids'], data['indptr'], data['neighbours'],
+                       data['scores'], float(data['built_at']))
+
+    def save(self, path) -> None:
+        # Written next to the target and renamed over it, so workers never
+        # load a half-written file
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(
+                dir=directory, suffix='.npz', delete=False) as file:
+            np.savez(file, book_ids=self.book_ids, indptr=self.indptr,
+                     neighbours=self.neighbours, scores=self.scores,
+                     built_at=np.float64(self.built_at))
+        os.replace(file.name, path)
+
+    def get(self, book_id: int, limit: int | None = None) -> list[dict]:
+        index = np.searchsorted(self.book_ids, book_id)
+        if index == len(self.book_ids) or self.book_ids[index] != book_id:
+            return []
+        start, end = self.indptr[index], self.indptr[index + 1]
+        if limit is not None:
+            end = min(end, start + limit)
+        return [{'id': int(neighbour), 'score': round(float(score), 4)}
+                for neighbour, score in zip(self.neighbours[start:end],
+                                            self.scores[start:end])]
+
+
+def similarity_rows(pairs, row_book_ids, counts) -> dict:
+    # Full (untruncated) cosine rows of `row_book_ids` over the users in
+    # `pairs`: co-occurrences / sqrt(readers of a * readers of b), where
+    # `counts` gives the readers of every book in `pairs`
+    if not len(pairs):
+        return {int(book_id): (np.empty(0, np.int64), np.empty(0, np.float32))
+                for book_id in row_book_ids}
+
+    _, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    book_ids, book_index = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_index, book_index)),
+        shape=(user_index.max() + 1, len(book_ids)))
+
+    positions = np.searchsorted(book_ids, row_book_ids)
+    found = (positions < len(book_ids)) & (
+        book_ids[np.minimum(positions, len(book_ids) - 1)] == row_book_ids)
+    norms = np.sqrt(np.array([counts[book_id] for book_id in book_ids],
+                             dtype=np.float32))
+
+    rows = {int(book_id): (np.empty(0, np.int64), np.empty(0, np.float32))
+            for book_id in row_book_ids[~found]}
+    # Co-occurrences a chunk of rows at a time, to bound memory
+    columns = matrix.T.tocsr()
+    positions = positions[found]
+    for chunk in range(0, len(positions), SIMILARITY_CHUNK_SIZE):
+        chunk_positions = positions[chunk:chunk + SIMILARITY_CHUNK_SIZE]
+        cooccurrences = (columns[chunk_positions] @ matrix).tocsr()
+        for row, position in enumerate(chunk_positions):
+            start = cooccurrences.indptr[row]
+            end = cooccurrences.indptr[row + 1]
+            others = cooccurrences.indices[start:end]
+            keep = others != position
+            others = others[keep]
+            scores = cooccurrences.data[start:end][keep] / (
+                norms[position] * norms[others])
+            rows[int(book_ids[position])] = (
+                book_ids[others], scores.astype(np.float32))
+    return rows
+
+
+def build_similar_books() -> SimilarBooks:
+    """
+    Compute the top STORE_SIMILAR_BOOKS_K neighbours of every book from
+    all positive relations.
+    """
+    built_at = time.time()
+    pairs = read_pairs(positive_relations())
+    book_ids, counts = np.unique(pairs[:, 1], return_counts=True)
+    rows = similarity_rows(pairs, book_ids, dict(zip(book_ids, counts)))
+
+    k = settings.STORE_SIMILAR_BOOKS_K
+    return SimilarBooks.from_rows({
+        book_id: top_neighbours(scores, neighbours, k)
+        for book_id, (neighbours, scores) in rows.items()}, built_at)
+
+
+def refresh_similar_books(similar: SimilarBooks) -> tuple[SimilarBooks, int]:
+    """
+    Recompute the rows of the books whose counters moved since
+    ``similar`` was built, and their entries in every other row. Other
+    rows keep their remaining neighbours, so a periodic full rebuild still
+    catches books that would have moved into their top k.
+    """
+    built_at = time.time()
+    # A second of margin for the clocks of other app servers
+    since = datetime.fromtimestamp(similar.built_at - 1, tz=timezone.utc)
+    changed_books = Book.objects.filter(updated_at__gte=since)
+    changed = np.fromiter(changed_books.values_list('pk', flat=True),
+                          dtype=np.int64)
+    if not len(changed):
+        return similar, 0
+
+    # Every positive relation of the users of the changed books, and the
+    # global readers count of every book those users touched
+    users = positive_relations().filter(
+        book_id__in=changed_books.values('pk')).values('user_id')
+    pairs = read_pairs(positive_relations().filter(user_id__in=users))
+    touched = positive_relations().filter(user_id__in=users).values('book_id')
+    counts = dict(positive_relations().filter(book_id__in=touched).order_by(
+        ).values_list('book_id').annotate(Count('id')))
+    fresh = similarity_rows(pairs, changed, counts)
+
+    k = settings.STORE_SIMILAR_BOOKS_K
+    rows = similar.to_rows()
+    # Cosine is symmetric: a changed book's score in the row of book b is
+    # b's score in the changed book's row
+    incoming = {}
+    for book_id, (neighbours, scores) in fresh.items():
+        for neighbour, score in zip(neighbours.tolist(), scores.tolist()):
+            incoming.setdefault(neighbour, []).append((book_id, score))
+
+    for book_id, (neighbours, scores) in rows.items():
+        if book_id in fresh:
+            continue
+        keep = ~np.isin(neighbours, changed)
+        added = incoming.pop(book_id, [])
+        rows[book_id] = top_neighbours(
+            np.concatenate([scores[keep], [score for _, score in added]]),
+            np.concatenate([neighbours[keep],
+                            [neighbour for neighbour, _ in added]]).astype(
+                                np.int64), k)
+    for book_id, added in incoming.items():
+        if book_id not in fresh:
+            rows[book_id] = top_neighbours(
+                np.array([score for _, score in added], dtype=np.float32),
+                np.array([neighbour for neighbour, _ in added],
+                         dtype=np.int64), k)
+    for book_id, (neighbours, scores) in fresh.items():
+        rows[book_id] = top_neighbours(scores, neighbours, k)
+
+    rows = {book_id: row for book_id, row in rows.items() if len(row[0])}
+    return SimilarBooks.from_rows(rows, built_at), len(changed)
+
+
+class SimilarBooksFile:
+    # STORE_SIMILAR_BOOKS_PATH, loaded once per worker and again whenever
+    # a rebuild or refresh has replaced the file
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.similar = None
+
+    def get(self) -> SimilarBooks | None:
+        path = settings.STORE_SIMILAR_BOOKS_PATH
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        key = (path, stat.st_mtime_ns, stat.st_ino)
+        if key != self.key:
+            with self.lock:
+                if key != self.key:
+                    self.similar = SimilarBooks.load(path)
+                    self.key = key
+        return self.similar
+
+
+similar_books = SimilarBooksFile()
@@ -0,0 +1,49 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+class ReplicaState:
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+# Set for the duration of a request by store.middleware.ReplicaMiddleware
+replica_state = ContextVar('store_replica_state', default=None)
+
+
+def reads_replica() -> bool:
+    # Whether reads of store models go to a replica right now
+    state = replica_state.get()
+    return bool(state is not None and state.use_replica and not state.wrote
+                and settings.STORE_REPLICA_DATABASES)
+
+
+class ReplicaRouter:
+    # Reads of store models go to a random replica while the current
+    # request allows it and hasn't written anything yet. Everything else,
+    # including sessions and users, stays on the primary.
+
+    def db_for_read(self, model, **hints):
+        if reads_replica() and model._meta.app_label == 'store':
+            return random.choice(settings.STORE_REPLICA_DATABASES)
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = replica_state.get()
+        if state is not None:
+            state.wrote = True
+        # Explicit, so objects read from a replica are saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.STORE_REPLICA_DATABASES:
+            return False
+        return None
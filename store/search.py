@@ -0,0 +1,143 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+# The search index lives outside of the Django models: a generated tsvector
+# column with a GIN index on PostgreSQL, an external content FTS5 table kept
+# in sync by triggers on SQLite. Other backends fall back to icontains.
+POSTGRESQL_INSTALL = (
+    "ALTER TABLE store_book ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(author_name, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS store_book_search_vector_idx "
+    "ON store_book USING gin (search_vector)",
+)
+POSTGRESQL_UNINSTALL = (
+    "DROP INDEX IF EXISTS store_book_search_vector_idx",
+    "ALTER TABLE store_book DROP COLUMN IF EXISTS search_vector",
+)
+
+SQLITE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_book_fts USING fts5("
+    "name, author_name, content='store_book', content_rowid='id')",
+)
+SQLITE_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_ai AFTER INSERT ON store_book "
+    "BEGIN "
+    "INSERT INTO store_book_fts(rowid, name, author_name) "
+    "VALUES (new.id, new.name, new.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_ad AFTER DELETE ON store_book "
+    "BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_au "
+    "AFTER UPDATE OF name, author_name ON store_book "
+    "BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "INSERT INTO store_book_fts(rowid, name, author_name) "
+    "VALUES (new.id, new.name, new.author_name); "
+    "END",
+    "INSERT INTO store_book_fts(store_book_fts) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    "DROP TRIGGER IF EXISTS store_book_fts_ai",
+    "DROP TRIGGER IF EXISTS store_book_fts_ad",
+    "DROP TRIGGER IF EXISTS store_book_fts_au",
+    "DROP TABLE IF EXISTS store_book_fts",
+)
+
+
+def _execute(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install_search_index(connection):
+    if connection.vendor == 'postgresql':
+        _execute(connection, POSTGRESQL_INSTALL)
+    elif connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_TABLE + SQLITE_TRIGGERS)
+
+
+def uninstall_search_index(connection):
+    if connection.vendor == 'postgresql':
+        _execute(connection, POSTGRESQL_UNINSTALL)
+    elif connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_UNINSTALL)
+
+
+def restore_sqlite_triggers(using='default', **kwargs):
+    # SQLite migrations that rebuild store_book drop its triggers with the
+    # old table, so put them back (and reindex) after every migrate.
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE name LIKE 'store_book_fts%'")
+        installed = {name for _, name in cursor.fetchall()}
+
+    if 'store_book_fts' in installed and not {
+            'store_book_fts_ai', 'store_book_fts_ad',
+            'store_book_fts_au'} <= installed:
+        _execute(connection, SQLITE_TRIGGERS)
+
+
+def _postgresql_search(terms):
+    query = ' & '.join(f'{term}:*' for term in terms)
+    matches = RawSQL(
+        "store_book.search_vector @@ to_tsquery('simple', %s)",
+        (query,), output_field=BooleanField())
+    rank = RawSQL(
+        "ts_rank(store_book.search_vector, to_tsquery('simple', %s))",
+        (query,), output_field=FloatField())
+    return matches, rank
+
+
+def _sqlite_search(terms):
+    query = ' '.join(f'"{term}"*' for term in terms)
+    matches = RawSQL(
+        "store_book.id IN (SELECT rowid FROM store_book_fts "
+        "WHERE store_book_fts MATCH %s)",
+        (query,), output_field=BooleanField())
+    # bm25() is lower for better matches, flip it to sort like ts_rank().
+    rank = RawSQL(
+        "(SELECT -bm25(store_book_fts) FROM store_book_fts "
+        "WHERE store_book_fts MATCH %s AND rowid = store_book.id)",
+        (query,), output_field=FloatField())
+    return matches, rank
+
+
+SEARCH_BACKENDS = {
+    'postgresql': _postgresql_search,
+    'sqlite': _sqlite_search,
+}
+
+
+class BookSearchFilter(SearchFilter):
+    # Same ?search= parameter as SearchFilter, answered from the full-text
+    # index and ordered by relevance unless the client asks for an ordering.
+
+    def filter_queryset(self, request, queryset, view):
+        backend = SEARCH_BACKENDS.get(connections[queryset.db].vendor)
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        terms = re.findall(r'\w+', ' '.join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+
+        matches, rank = backend(terms)
+        return queryset.filter(matches).annotate(
+            search_rank=rank).order_by('-search_rank', 'id')
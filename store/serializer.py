@@ -1,29 +1,264 @@
+from itertools import chain
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Manager
+from django.db.models import Q
+from django.db.models import Window
+from django.db.models.functions import RowNumber
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import ModelSerializer
 from django.contrib.auth.models import User
+from .cache import rating_histogram_key
 from .models import UserBookRelation
 
+from store.models import Author
 from store.models import Book
 from rest_framework import serializers
 
 
+def get_readers_preview_size(context):
+    request = context.get('request')
+    if request is None:
+        return settings.STORE_READERS_PREVIEW
+    try:
+        size = int(request.query_params.get(
+            'readers', settings.STORE_READERS_PREVIEW))
+    except ValueError:
+        return settings.STORE_READERS_PREVIEW
+    return max(0, min(size, settings.STORE_READERS_PREVIEW_MAX))
+
+
+def get_requested_fields(request, available, default=None):
+    # Fields picked with ?fields=a,b in their order in `available`, or the
+    # default ones (all of them unless given)
+    default = available if default is None else default
+    if request is None:
+        return default
+    requested = {field.strip() for field in
+                 request.query_params.get('fields', '').split(',')} - {''}
+    if not requested:
+        return default
+    unknown = requested.difference(available)
+    if unknown:
+        raise ValidationError({'fields': [
+            f'Unknown fields: {", ".join(sorted(unknown))}.']})
+    return tuple(field for field in available if field in requested)
+
+
+def get_readers_preview(book_ids, size):
+    # First `size` readers of every book in one query, numbered per book
+    # with ROW_NUMBER() instead of loading every reader of every book.
+    if not book_ids or not size:
+        return {}
+
+    relations = UserBookRelation.objects.filter(book_id__in=book_ids).annotate(
+        preview_position=Window(
+            RowNumber(), partition_by=F('book_id'), order_by=F('id').asc()),
+    ).values_list('book_id', 'user__first_name', 'user__last_name',
+                  'preview_position')
+    sql, params = relations.query.sql_with_params()
+
+    readers = {}
+    with connections[relations.db].cursor() as cursor:
+        cursor.execute(
+            f'SELECT * FROM ({sql}) preview WHERE preview_position <= %s',
+            (*params, size))
+        for book_id, first_name, last_name, _ in cursor.fetchall():
+            readers.setdefault(book_id, []).append(
+                {'first_name': first_name, 'last_name': last_name})
+    return readers
+
+
+def get_rating_histograms(book_ids):
+    # {book id: {'1': count, ..., '5': count}}, cached per book until one
+    # of its ratings changes. The misses are counted in one grouped
+    # conditional aggregation over the relations.
+    keys = {rating_histogram_key(book_id): book_id for book_id in book_ids}
+    histograms = {keys[key]: histogram
+                  for key, histogram in cache.get_many(keys).items()}
+
+    missing = [book_id for book_id in book_ids if book_id not in histograms]
+    if missing:
+        rates = [str(rate) for rate, _ in UserBookRelation.RATING_CHOICES]
+        built = {book_id: dict.fromkeys(rates, 0) for book_id in missing}
+        counts = UserBookRelation.objects.filter(
+            book_id__in=missing, rate__isnull=False).order_by().values(
+                'book_id').annotate(**{
+                    f'rate_{rate}': Count('id', filter=Q(rate=rate))
+                    for rate in rates})
+        for row in counts:
+            built[row['book_id']] = {
+                rate: row[f'rate_{rate}'] for rate in rates}
+        cache.set_many({rating_histogram_key(book_id): histogram
+                        for book_id, histogram in built.items()},
+                       timeout=settings.STORE_CACHE_TIMEOUT)
+        histograms.update(built)
+    return histograms
+
+
 class BookReaderSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('first_name', 'last_name')
 
 
+class BooksListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        books = list(data.all() if isinstance(data, Manager) else data)
+        self.add_page_context(books)
+        return super().to_representation(books)
+
+    def add_page_context(self, books):
+        if 'readers_preview' not in self._context and self.needs_readers():
+            self._context['readers_preview'] = get_readers_preview(
+                [book['id'] if isinstance(book, dict) else book.pk
+                 for book in books],
+                get_readers_preview_size(self.context))
+
+    def needs_readers(self):
+        return True
+
+
+class BookValuesListSerializer(BooksListSerializer):
+
+    def add_page_context(self, rows):
+        super().add_page_context(rows)
+        if ('rating_histograms' not in self._context
+                and 'rating_histogram' in self.child.requested_fields):
+            self._context['rating_histograms'] = get_rating_histograms(
+                [row['id'] for row in rows])
+
+    def needs_readers(self):
+        return 'readers' in self.child.requested_fields
+
+
 class BooksSerializer(ModelSerializer):
-    likes = serializers.IntegerField(read_only=True)
+    likes = serializers.IntegerField(source='likes_count', read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2,
                                       read_only=True)
     owner_name = serializers.CharField(source='owner.username',
                                        read_only=True, default='')
-    readers = BookReaderSerializer(many=True, read_only=True)
+    readers_count = serializers.IntegerField(read_only=True)
+    readers = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
-        fields = ('id', 'name', 'price', 'author_name',
-                  'likes', 'rating', 'owner_name', 'readers')
+        fields = ('id', 'name', 'price', 'author_name', 'likes', 'rating',
+                  'owner_name', 'readers_count', 'readers')
+        list_serializer_class = BooksListSerializer
+
+    def get_readers(self, book):
+        previews = self.context.get('readers_preview')
+        if previews is None:
+            previews = get_readers_preview(
+                [book.pk], get_readers_preview_size(self.context))
+        return previews.get(book.pk, [])
+
+
+class BookValuesSerializer(serializers.BaseSerializer):
+    # Read-only twin of BooksSerializer for list and retrieve. It works on
+    # .values() rows with converters built once, and shares the per-page
+    # readers preview query of BooksListSerializer. ?fields= limits both
+    # the output and the columns read, see get_queryset().
+
+    # Output field -> the get_books_queryset() columns it is built from
+    columns = {
+        'id': ('id',),
+        'name': ('name',),
+        'price': ('price',),
+        'author_name': ('author_name',),
+        'likes': ('likes_count',),
+        'rating': ('rating',),
+        'owner_name': ('owner__username',),
+        'readers_count': ('readers_count',),
+        'readers': ('id',),
+        'rating_histogram': ('id',),
+    }
+    # rating_histogram is only sent when asked for with ?fields=
+    default_fields = tuple(
+        field for field in columns if field != 'rating_histogram')
+
+    price = serializers.DecimalField(
+        max_digits=7, decimal_places=2).to_representation
+    rating = serializers.DecimalField(
+        max_digits=3, decimal_places=2).to_representation
+
+    class Meta:
+        list_serializer_class = BookValuesListSerializer
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        return get_requested_fields(
+            request, tuple(cls.columns), cls.default_fields)
+
+    @classmethod
+    def get_values(cls, fields=None):
+        # The id is always read: it keys the readers preview and the cursors
+        columns = (cls.columns[field]
+                   for field in fields or cls.default_fields)
+        return tuple(dict.fromkeys(('id', *chain.from_iterable(columns))))
+
+    @classmethod
+    def get_queryset(cls, queryset, fields=None):
+        # Without owner_name there is no owner join, without readers no
+        # preview query
+        return queryset.prefetch_related(None).values(*cls.get_values(fields))
+
+    @cached_property
+    def requested_fields(self):
+        return self.get_requested_fields(self.context.get('request'))
+
+    @cached_property
+    def getters(self):
+        return [(field, getattr(self, f'get_{field}'))
+                for field in self.requested_fields]
+
+    def to_representation(self, row):
+        return {field: getter(row) for field, getter in self.getters}
+
+    get_id = itemgetter('id')
+    get_name = itemgetter('name')
+    get_author_name = itemgetter('author_name')
+    get_likes = itemgetter('likes_count')
+    get_readers_count = itemgetter('readers_count')
+
+    def get_price(self, row):
+        return self.price(row['price'])
+
+    def get_rating(self, row):
+        rating = row['rating']
+        return None if rating is None else self.rating(rating)
+
+    def get_owner_name(self, row):
+        owner_name = row['owner__username']
+        return '' if owner_name is None else owner_name
+
+    def get_readers(self, row):
+        previews = self.context.get('readers_preview')
+        if previews is None:
+            previews = get_readers_preview(
+                [row['id']], get_readers_preview_size(self.context))
+        return previews.get(row['id'], [])
+
+    def get_rating_histogram(self, row):
+        histograms = self.context.get('rating_histograms')
+        if histograms is None:
+            histograms = get_rating_histograms([row['id']])
+        return histograms[row['id']]
+
+
+class AuthorSerializer(ModelSerializer):
+
+    class Meta:
+        model = Author
+        fields = ('id', 'name', 'books_count', 'rating')
 
 
 class UserBookRelationsSerializer(ModelSerializer):
@@ -0,0 +1,136 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from store.cache import bump_books_version
+from store.cache import invalidate_user_cache
+from store.logic import counters_delta
+from store.logic import get_author_ids
+from store.logic import negate
+from store.logic import rebuild_author_counters
+from store.logic import rebuild_book_counters
+from store.logic import relation_counters
+from store.logic import update_book_counters
+from store.models import Book
+from store.models import UserBookRelation
+
+COUNTED_FIELDS = {'book_id', 'like', 'rate'}
+# User fields serialized with books
+USER_DISPLAY_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def _counted_state(instance):
+    # Deferred fields would cost a query per instance, so they are left
+    # unknown here and the book is recounted from scratch on save.
+    if COUNTED_FIELDS & instance.get_deferred_fields():
+        return None
+    return instance.book_id, relation_counters(instance.like, instance.rate)
+
+
+@receiver(post_init, sender=UserBookRelation)
+def remember_relation_counters(sender, instance, **kwargs):
+    instance._counted = _counted_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=UserBookRelation)
+def update_counters_on_relation_save(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_counted', None)
+    instance._counted = new = _counted_state(instance)
+
+    if new is None or (old is None and not created):
+        rebuild_book_counters(book_ids=[instance.book_id])
+        return
+
+    book_id, counters = new
+    if old is None:
+        update_book_counters(book_id, **counters)
+    elif old[0] != book_id:
+        update_book_counters(old[0], **negate(old[1]))
+        update_book_counters(book_id, **counters)
+    else:
+        update_book_counters(book_id, **counters_delta(old[1], counters))
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def update_counters_on_relation_delete(sender, instance, origin=None,
+                                       **kwargs):
+    # Relations deleted along with their book leave no counters to fix,
+    # its author's are recounted once the book is gone
+    if (isinstance(origin, Book) or isinstance(origin, QuerySet)
+            and origin.model is Book):
+        return
+    state = getattr(instance, '_counted', None) or _counted_state(instance)
+    if state is None:
+        return
+    book_id, old = state
+    update_book_counters(book_id, **negate(old))
+
+
+@receiver(pre_save, sender=Book)
+def assign_author(sender, instance, update_fields=None, **kwargs):
+    # The author id as loaded, before it follows author_name
+    instance._previous_author_id = instance.author_id
+    if update_fields is None or 'author_name' in update_fields:
+        instance.author_id = get_author_ids(
+            [instance.author_name])[instance.author_name]
+
+
+@receiver(post_save, sender=Book)
+def update_author_counters_on_book_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_author_id', None)
+    if created or previous != instance.author_id:
+        rebuild_author_counters(
+            {previous, instance.author_id}.difference({None}))
+
+
+@receiver(pre_delete, sender=Book)
+def remember_book_author(sender, instance, **kwargs):
+    # Loaded while the row is still there, in case the field is deferred
+    instance._previous_author_id = instance.author_id
+
+
+@receiver(post_delete, sender=Book)
+def update_author_counters_on_book_delete(sender, instance, **kwargs):
+    if instance._previous_author_id is not None:
+        rebuild_author_counters([instance._previous_author_id])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def invalidate_books_cache(sender, **kwargs):
+    # After the commit, or a read in between would cache the old rows
+    # under the new version
+    transaction.on_commit(bump_books_version)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user_cache(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_books_cache_on_user_change(sender, instance, created=False,
+                                          update_fields=None, **kwargs):
+    # Books show their owner's and readers' names, but a login only
+    # updates last_login
+    if created or (update_fields is not None
+                   and not USER_DISPLAY_FIELDS & set(update_fields)):
+        return
+    transaction.on_commit(bump_books_version)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, user, **kwargs):
+    if user is not None:
+        invalidate_user_cache(user.pk)
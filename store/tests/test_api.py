@@ -1,22 +1,40 @@
+import csv
+from base64 import b64encode
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.status import HTTP_200_OK
 from rest_framework.status import HTTP_201_CREATED
 from rest_framework.status import HTTP_204_NO_CONTENT
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.status import HTTP_403_FORBIDDEN
+from rest_framework.status import HTTP_404_NOT_FOUND
 from rest_framework.test import APITestCase
 from rest_framework.utils.json import dumps
+from rest_framework.utils.json import loads
 
+from store.cache import bump_books_version
+from store.models import Author
 from store.models import Book
 from store.models import UserBookRelation
 from store.serializer import BooksSerializer
+from store.serializer import BookValuesSerializer
 from store.views import get_books_queryset
+from store.views import UserBookRelationViewSet
 
 
 class BooksApiTestCase(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.user1 = User.objects.create(username='Test User')
         self.book1 = Book.objects.create(
             name='Test', price=434.99, author_name='Author 1',
@@ -43,9 +61,9 @@ class BooksApiTestCase(APITestCase):
         books = get_books_queryset()
         serialized_data = BooksSerializer(books, many=True).data
 
-        self.assertEqual(serialized_data, response.data)
-        self.assertIn('rating', response.json()[0].keys())
-        self.assertIn('likes', response.json()[0].keys())
+        self.assertEqual(serialized_data, response.data['results'])
+        self.assertIn('rating', response.json()['results'][0].keys())
+        self.assertIn('likes', response.json()['results'][0].keys())
 
     def test_get_filter(self):
         url = reverse('book-list')
@@ -56,7 +74,7 @@ class BooksApiTestCase(APITestCase):
                 id__in=(self.book3.pk, self.book2.pk))
 
         serialized_data = BooksSerializer(books, many=True).data
-        self.assertEqual(response.data, serialized_data)
+        self.assertEqual(response.data['results'], serialized_data)
 
     def test_get_search(self):
         url = reverse('book-list')
@@ -67,7 +85,98 @@ class BooksApiTestCase(APITestCase):
                 id__in=(self.book1.pk, self.book2.pk))
 
         serialized_data = BooksSerializer(books, many=True).data
-        self.assertEqual(response.data, serialized_data)
+        self.assertEqual(response.data['results'], serialized_data)
+
+    def test_get_pages(self):
+        url = reverse('book-list')
+
+        response = self.client.get(url, data={'page_size': 2})
+        self.assertEqual([self.book1.pk, self.book2.pk],
+                         [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([self.book3.pk],
+                         [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([self.book1.pk, self.book2.pk],
+                         [book['id'] for book in response.data['results']])
+
+    def test_get_pages_ordering(self):
+        url = reverse('book-list')
+
+        response = self.client.get(
+            url, data={'page_size': 1, 'ordering': '-price'})
+        ids = [book['id'] for book in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [book['id'] for book in response.data['results']]
+
+        self.assertEqual([self.book1.pk, self.book3.pk, self.book2.pk], ids)
+
+    def test_get_invalid_cursor(self):
+        url = reverse('book-list')
+
+        response = self.client.get(url, data={'cursor': 'garbage'})
+
+        self.assertEqual(HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_get_crafted_cursor(self):
+        url = reverse('book-list')
+
+        for ordering, position in (('id', '["abc"]'), ('id', '[{"a": 1}]'),
+                                   ('id', '[null]'), ('price', '["x", 1]')):
+            cursor = b64encode(urlencode({'p': position}).encode()).decode()
+            response = self.client.get(
+                url, data={'cursor': cursor, 'ordering': ordering})
+
+            self.assertEqual(HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_export_ndjson(self):
+        url = reverse('book-export')
+        response = self.client.get(url, data={'price': 45})
+
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        rows = [loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([self.book2.pk, self.book3.pk],
+                         [row['id'] for row in rows])
+        self.assertEqual({'id': self.book2.pk, 'name': 'Test book 2 Author 1',
+                          'price': '45.00', 'author_name': 'Author 3',
+                          'likes': 0, 'rating': None,
+                          'owner_name': 'Test User'}, rows[0])
+
+    def test_export_csv(self):
+        url = reverse('book-export')
+        response = self.client.get(
+            url, data={'export_format': 'csv', 'ordering': '-price'})
+
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        rows = list(csv.reader(
+            b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(['id', 'name', 'price', 'author_name', 'likes',
+                          'rating', 'owner_name'], rows[0])
+        self.assertEqual([str(self.book1.pk), str(self.book3.pk),
+                          str(self.book2.pk)], [row[0] for row in rows[1:]])
+
+    def test_export_without_owner(self):
+        book = Book.objects.create(name='Orphan', price=5,
+                                   author_name='Author 1')
+        url = reverse('book-export')
+        response = self.client.get(url, data={'search': 'Orphan'})
+
+        row, = [loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual((book.pk, ''), (row['id'], row['owner_name']))
+
+    def test_export_unknown_format(self):
+        url = reverse('book-export')
+        response = self.client.get(url, data={'export_format': 'xml'})
+
+        self.assertEqual(HTTP_400_BAD_REQUEST, response.status_code)
 
     def test_get_single_book(self):
         url = reverse('book-detail', kwargs={'pk': self.book2.pk})
@@ -207,6 +316,479 @@ class BooksApiTestCase(APITestCase):
         self.assertEqual(Book.objects.count(), 2)
 
 
+class BookReadersApiTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(username=f'reader{i}', first_name=f'First {i}',
+                                last_name=f'Last {i}')
+            for i in range(12)]
+        cls.book = Book.objects.create(
+            name='Popular', price=10, author_name='Author 1')
+        cls.other_book = Book.objects.create(
+            name='Unread', price=10, author_name='Author 2')
+        for user in cls.users:
+            UserBookRelation.objects.create(user=user, book=cls.book)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_preview(self):
+        response = self.client.get(reverse('book-list'))
+
+        book, other_book = response.data['results']
+        self.assertEqual(12, book['readers_count'])
+        self.assertEqual(
+            [{'first_name': f'First {i}', 'last_name': f'Last {i}'}
+             for i in range(3)], book['readers'])
+        self.assertEqual(0, other_book['readers_count'])
+        self.assertEqual([], other_book['readers'])
+
+    def test_preview_size(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+
+        response = self.client.get(url, data={'readers': 0})
+        self.assertEqual([], response.data['readers'])
+
+        response = self.client.get(url, data={'readers': 1000})
+        self.assertEqual(10, len(response.data['readers']))
+
+    def test_readers(self):
+        url = reverse('book-readers', kwargs={'pk': self.book.pk})
+
+        response = self.client.get(url, data={'page_size': 5})
+        readers = response.data['results']
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            readers += response.data['results']
+
+        self.assertEqual(
+            [{'first_name': user.first_name, 'last_name': user.last_name}
+             for user in self.users], readers)
+
+    def test_readers_unknown_book(self):
+        url = reverse('book-readers', kwargs={'pk': 0})
+        response = self.client.get(url)
+
+        self.assertEqual(HTTP_404_NOT_FOUND, response.status_code)
+
+
+class BookFieldsApiTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User',
+                                        first_name='Ann', last_name='Lee')
+        self.book1 = Book.objects.create(
+            name='Test', price=30, author_name='Author 1', owner=self.user)
+        self.book2 = Book.objects.create(
+            name='Test 2', price=20, author_name='Author 2')
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book1, like=True, rate=4)
+
+    def get_fields(self, url, fields):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'fields': fields})
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        return response.data, [query['sql'] for query in queries]
+
+    def test_list(self):
+        url = reverse('book-list')
+        full = self.client.get(url).data['results']
+
+        # fields, queries, owner join
+        cases = [
+            ('id,name,price', 1, False),
+            ('likes,rating,readers_count', 1, False),
+            ('owner_name', 1, True),
+            ('name,readers', 2, False),
+            ('id,owner_name,readers', 2, True),
+            ('', 2, True),
+        ]
+        for fields, count, join in cases:
+            with self.subTest(fields=fields):
+                cache.clear()
+                data, queries = self.get_fields(url, fields)
+
+                self.assertEqual(count, len(queries))
+                self.assertEqual(join, 'JOIN "auth_user"' in queries[0])
+                names = [name for name in fields.split(',') if name]
+                self.assertEqual(
+                    [{name: book[name] for name in names or book}
+                     for book in full],
+                    data['results'])
+
+    def test_retrieve(self):
+        url = reverse('book-detail', kwargs={'pk': self.book1.pk})
+
+        data, queries = self.get_fields(url, 'price, name')
+
+        self.assertEqual({'name': 'Test', 'price': '30.00'}, data)
+        self.assertEqual(2, len(queries))
+        self.assertNotIn('JOIN', queries[1])
+
+    def test_pages_ordering(self):
+        url = reverse('book-list')
+
+        response = self.client.get(
+            url, data={'fields': 'name', 'ordering': 'price', 'page_size': 1})
+        names = [book['name'] for book in response.data['results']]
+        response = self.client.get(response.data['next'])
+        names += [book['name'] for book in response.data['results']]
+
+        self.assertEqual(['Test 2', 'Test'], names)
+
+    def test_likes(self):
+        self.client.force_authenticate(self.user)
+
+        data, queries = self.get_fields(
+            reverse('userbookrelation-likes'), 'name')
+
+        self.assertEqual([{'name': 'Test'}], data['results'])
+        self.assertEqual(1, len(queries))
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('book-list'),
+                                   data={'fields': 'name,secret'})
+
+        self.assertEqual(HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(['Unknown fields: secret.'], response.data['fields'])
+
+
+class AuthorApiTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User', is_staff=True)
+        self.book1 = Book.objects.create(
+            name='Test', price=10, author_name='Author 1', owner=self.user)
+        self.book2 = Book.objects.create(
+            name='Test 2', price=10, author_name='Author 1')
+        self.book3 = Book.objects.create(
+            name='Test 3', price=10, author_name='Author 2')
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book1, rate=5)
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book2, rate=2)
+        self.author1 = Author.objects.get(name='Author 1')
+        self.author2 = Author.objects.get(name='Author 2')
+
+    def get_authors(self, **params):
+        response = self.client.get(reverse('author-list'), data=params)
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        return response.data['results']
+
+    def test_list(self):
+        self.assertEqual([
+            {'id': self.author1.pk, 'name': 'Author 1', 'books_count': 2,
+             'rating': '3.50'},
+            {'id': self.author2.pk, 'name': 'Author 2', 'books_count': 1,
+             'rating': None},
+        ], self.get_authors())
+        self.assertEqual(
+            [self.author2.pk],
+            [author['id'] for author in self.get_authors(name='Author 2')])
+        self.assertEqual(
+            [self.author2.pk, self.author1.pk],
+            [author['id'] for author in self.get_authors(ordering='books_count')])
+
+    def test_counters_follow_books(self):
+        self.client.force_authenticate(self.user)
+
+        self.client.patch(
+            reverse('userbookrelation-detail', args=(self.book2.pk,)),
+            {'rate': 4}, format='json')
+        self.client.patch(
+            reverse('book-detail', kwargs={'pk': self.book1.pk}),
+            {'author_name': 'Author 2'}, format='json')
+        self.client.delete(
+            reverse('book-detail', kwargs={'pk': self.book3.pk}))
+
+        self.author1.refresh_from_db()
+        self.author2.refresh_from_db()
+        self.assertEqual((1, Decimal('4.00')),
+                         (self.author1.books_count, self.author1.rating))
+        self.assertEqual((1, Decimal('5.00')),
+                         (self.author2.books_count, self.author2.rating))
+        self.assertEqual(self.author2, Book.objects.get(pk=self.book1.pk).author)
+
+    def test_books_by_author(self):
+        response = self.client.get(reverse('book-list'),
+                                   data={'author': self.author1.pk})
+
+        self.assertEqual(
+            [(self.book1.pk, 'Author 1'), (self.book2.pk, 'Author 1')],
+            [(book['id'], book['author_name'])
+             for book in response.data['results']])
+
+
+class BookRatingHistogramApiTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create(username=f'user{i}')
+                      for i in range(3)]
+        self.book1 = Book.objects.create(
+            name='Test', price=10, author_name='Author 1')
+        self.book2 = Book.objects.create(
+            name='Test 2', price=10, author_name='Author 2')
+        for user, rate in zip(self.users, (5, 5, 2)):
+            UserBookRelation.objects.create(
+                user=user, book=self.book1, rate=rate)
+        UserBookRelation.objects.create(
+            user=self.users[0], book=self.book2, like=True)
+
+    def get_histograms(self):
+        response = self.client.get(reverse('book-list'),
+                                   data={'fields': 'id,rating_histogram'})
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        return {book['id']: book['rating_histogram']
+                for book in response.data['results']}
+
+    def test_list(self):
+        with self.assertNumQueries(2):
+            histograms = self.get_histograms()
+
+        self.assertEqual({
+            self.book1.pk: {'1': 0, '2': 1, '3': 0, '4': 0, '5': 2},
+            self.book2.pk: {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0},
+        }, histograms)
+
+        response = self.client.get(reverse('book-list'))
+        self.assertNotIn('rating_histogram', response.data['results'][0])
+
+    def test_cached_per_book(self):
+        self.get_histograms()
+        bump_books_version()
+
+        # Only the page query, every histogram is cached
+        with self.assertNumQueries(1):
+            self.get_histograms()
+
+        self.client.force_authenticate(self.users[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('userbookrelation-detail', args=(self.book1.pk,)),
+                {'rate': 1}, format='json')
+
+        with CaptureQueriesContext(connection) as queries:
+            histograms = self.get_histograms()
+        self.assertEqual(2, len(queries))
+        self.assertIn(f'IN ({self.book1.pk})', queries[1]['sql'])
+        self.assertEqual({'1': 1, '2': 1, '3': 0, '4': 0, '5': 1},
+                         histograms[self.book1.pk])
+
+    def test_retrieve(self):
+        url = reverse('book-detail', kwargs={'pk': self.book1.pk})
+
+        response = self.client.get(
+            url, data={'fields': 'rating,rating_histogram'})
+
+        self.assertEqual({
+            'rating': '4.00',
+            'rating_histogram': {'1': 0, '2': 1, '3': 0, '4': 0, '5': 2},
+        }, response.data)
+
+
+@override_settings(STORE_FACET_PRICE_BUCKETS=[10, 50], STORE_FACET_AUTHORS=2)
+class BookFacetsApiTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, price, author_name in [
+                ('Cheap', 5, 'Author 1'),
+                ('Ten', 10, 'Author 1'),
+                ('Middle', '49.99', 'Author 2'),
+                ('Fifty', 50, 'Author 3'),
+                ('Dear', 500, 'Author 2'),
+                ('Dear again', 600, 'Author 2')]:
+            Book.objects.create(name=name, price=price,
+                                author_name=author_name)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_facets(self):
+        url = reverse('book-facets')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        self.assertEqual({
+            'count': 6,
+            'price': [
+                {'min': None, 'max': '10.00', 'count': 1},
+                {'min': '10.00', 'max': '50.00', 'count': 2},
+                {'min': '50.00', 'max': None, 'count': 3},
+            ],
+            'authors': [
+                {'author_name': 'Author 2', 'count': 3},
+                {'author_name': 'Author 1', 'count': 2},
+            ],
+        }, response.data)
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_facets_filtered(self):
+        response = self.client.get(reverse('book-facets'),
+                                   data={'search': 'dear', 'ordering': 'price'})
+
+        self.assertEqual(2, response.data['count'])
+        self.assertEqual([0, 0, 2], [bucket['count']
+                                     for bucket in response.data['price']])
+        self.assertEqual([{'author_name': 'Author 2', 'count': 2}],
+                         response.data['authors'])
+
+    def test_drill_down(self):
+        bucket = self.client.get(reverse('book-facets')).data['price'][1]
+
+        response = self.client.get(reverse('book-list'), data={
+            'price__gte': bucket['min'], 'price__lt': bucket['max']})
+
+        self.assertEqual(['Ten', 'Middle'],
+                         [book['name'] for book in response.data['results']])
+        response = self.client.get(reverse('book-list'), data={
+            'price__gte': 10, 'price__lte': 50})
+        self.assertEqual(3, len(response.data['results']))
+
+
+class BookLeaderboardApiTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f'user{i}')
+                     for i in range(11)]
+        cls.book1 = Book.objects.create(
+            name='One vote', price=10, author_name='Author 1')
+        cls.book2 = Book.objects.create(
+            name='Ten votes', price=10, author_name='Author 2')
+        cls.book3 = Book.objects.create(
+            name='Disliked', price=10, author_name='Author 3')
+        cls.book4 = Book.objects.create(
+            name='Unread', price=10, author_name='Author 4')
+
+        UserBookRelation.objects.create(
+            user=cls.users[10], book=cls.book1, rate=5, like=True)
+        UserBookRelation.objects.create(
+            user=cls.users[10], book=cls.book3, rate=1)
+        for user in cls.users[:10]:
+            UserBookRelation.objects.create(
+                user=user, book=cls.book2, rate=5, like=user.pk % 2 == 0)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_ids(self, url_name, **params):
+        response = self.client.get(reverse(url_name), data=params)
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        return [book['id'] for book in response.data['results']], response
+
+    def test_top_rated(self):
+        ids, response = self.get_ids('book-top-rated')
+
+        self.assertEqual([self.book2.pk, self.book1.pk, self.book3.pk], ids)
+        self.assertEqual('5.00', response.data['results'][1]['rating'])
+
+        ids, response = self.get_ids('book-top-rated', page_size=2)
+        self.assertEqual([self.book2.pk, self.book1.pk], ids)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([self.book3.pk],
+                         [book['id'] for book in response.data['results']])
+
+    def test_most_liked(self):
+        ids, _ = self.get_ids('book-most-liked')
+
+        self.assertEqual([self.book2.pk, self.book1.pk], ids)
+
+    def test_updated_by_relations(self):
+        for user in self.users[:10]:
+            UserBookRelation.objects.create(
+                user=user, book=self.book1, rate=5, like=True)
+
+        ids, _ = self.get_ids('book-most-liked')
+        self.assertEqual([self.book1.pk, self.book2.pk], ids)
+        ids, _ = self.get_ids('book-top-rated')
+        self.assertEqual(self.book1.pk, ids[0])
+
+
+class BookImportApiTestCase(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create(username='Admin', is_staff=True)
+        self.url = reverse('book-import')
+
+    def upload(self, name, content, **params):
+        return self.client.post(
+            f'{self.url}?{urlencode(params)}',
+            {'file': SimpleUploadedFile(name, content.encode())})
+
+    @override_settings(STORE_IMPORT_BATCH_SIZE=2)
+    def test_csv(self):
+        self.client.force_authenticate(self.admin)
+        content = ('name,price,author_name\n'
+                   'Book 1,10.50,Author 1\n'
+                   '"Book, 2",20,Author 2\n'
+                   'Book 3,not a price,Author 3\n'
+                   'Book 4,40,Author 4\n')
+
+        # Two batches inside savepoints here: the authors are looked up and
+        # created, the books inserted and the authors recounted
+        with self.assertNumQueries(14):
+            response = self.upload('catalog.csv', content)
+
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        self.assertEqual(3, response.data['created'])
+        self.assertEqual(1, response.data['failed'])
+        self.assertEqual(4, response.data['errors'][0]['line'])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertEqual(
+            [('Book 1', Decimal('10.50'), self.admin),
+             ('Book, 2', Decimal('20.00'), self.admin),
+             ('Book 4', Decimal('40.00'), self.admin)],
+            [(book.name, book.price, book.owner)
+             for book in Book.objects.order_by('pk')])
+        self.assertEqual(
+            ['Author 1', 'Author 2', 'Author 4'],
+            list(Author.objects.filter(books_count=1).order_by(
+                'name').values_list('name', flat=True)))
+
+    def test_ndjson_dry_run(self):
+        self.client.force_login(self.admin)
+        content = ('{"name": "Book 1", "price": "1", "author_name": "A"}\n'
+                   '\n'
+                   'not json\n'
+                   '["name"]\n')
+
+        response = self.upload('catalog.jsonl', content,
+                               import_format='ndjson', dry_run='true')
+
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        self.assertEqual(1, response.data['created'])
+        self.assertEqual([3, 4], [error['line']
+                                  for error in response.data['errors']])
+        self.assertFalse(Book.objects.exists())
+
+    def test_bad_requests(self):
+        self.client.force_login(self.admin)
+
+        response = self.upload('catalog.xml', '<books/>')
+        self.assertEqual(HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('import_format', response.data)
+
+        response = self.client.post(self.url, {})
+        self.assertEqual(HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('file', response.data)
+
+    def test_not_admin(self):
+        self.client.force_login(User.objects.create(username='Test User'))
+
+        response = self.upload('catalog.csv', 'name,price,author_name\n')
+
+        self.assertEqual(HTTP_403_FORBIDDEN, response.status_code)
+
+
 class BookRelationApiTestCase(APITestCase):
 
     @classmethod
@@ -239,6 +821,8 @@ class BookRelationApiTestCase(APITestCase):
             user=self.user1, book=self.book1)
 
         self.assertTrue(relation.like)
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.likes_count, 1)
 
         payload = {
             'in_bookmarks': True
@@ -272,6 +856,24 @@ class BookRelationApiTestCase(APITestCase):
 
         self.assertEqual(relation.rate, 4)
 
+    def test_concurrent_likes_counted_once(self):
+        # A request that read the relation before another one liked it
+        stale = UserBookRelation.objects.create(user=self.user1,
+                                                book=self.book1)
+        other = UserBookRelation.objects.get(pk=stale.pk)
+        other.like = True
+        other.save()
+
+        self.client.force_login(self.user1)
+        url = reverse('userbookrelation-detail', args=(self.book1.pk,))
+        with mock.patch.object(UserBookRelationViewSet, 'get_object',
+                               return_value=stale):
+            response = self.client.patch(url, {'like': True}, format='json')
+
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.likes_count, 1)
+
     def test_rate_wrong(self):
         url = reverse('userbookrelation-detail', args=(self.book1.pk,))
         payload = {
@@ -290,3 +892,99 @@ class BookRelationApiTestCase(APITestCase):
             user=self.user1, book=self.book1)
 
         self.assertEqual(relation.rate, None)
+
+    def test_bulk(self):
+        UserBookRelation.objects.create(
+            user=self.user1, book=self.book2, like=True, rate=2)
+        url = reverse('userbookrelation-bulk')
+        payload = [
+            {'book': self.book1.pk, 'like': True},
+            {'book': self.book2.pk, 'rate': 5},
+            {'book': self.book1.pk, 'in_bookmarks': True},
+            {'book': self.book3.pk, 'rate': 6},
+            {'book': 0, 'like': True},
+            {'like': True},
+            {'book': True, 'like': True},
+            {'book': self.book1.pk + 0.5, 'like': True},
+        ]
+
+        self.client.force_login(self.user1)
+        # The session comes from the cache, the user is loaded once. The
+        # rating change also moves the author's rating.
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                url, data=dumps(payload), content_type='application/json')
+
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            {'book': self.book1.pk, 'like': True, 'in_bookmarks': True,
+             'rate': None}, response.data[0]['data'])
+        self.assertEqual(5, response.data[1]['data']['rate'])
+        self.assertIn('rate', response.data[3]['errors'])
+        self.assertIn('book', response.data[4]['errors'])
+        self.assertIn('book', response.data[5]['errors'])
+        self.assertIn('book', response.data[6]['errors'])
+        self.assertIn('book', response.data[7]['errors'])
+
+        relation = UserBookRelation.objects.get(
+            user=self.user1, book=self.book1)
+        self.assertTrue(relation.like)
+        self.assertTrue(relation.in_bookmarks)
+        relation = UserBookRelation.objects.get(
+            user=self.user1, book=self.book2)
+        self.assertTrue(relation.like)
+        self.assertEqual(relation.rate, 5)
+        self.assertFalse(UserBookRelation.objects.filter(
+            book=self.book3).exists())
+
+        self.book1.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.assertEqual(self.book1.likes_count, 1)
+        self.assertEqual(self.book2.likes_count, 1)
+        self.assertEqual(self.book2.rating_sum, 5)
+        self.assertEqual(self.book2.rating_count, 1)
+
+    def test_bookmarks_and_likes(self):
+        other = User.objects.create(username='Other User')
+        UserBookRelation.objects.create(
+            user=self.user1, book=self.book3, in_bookmarks=True, like=True)
+        UserBookRelation.objects.create(
+            user=self.user1, book=self.book1, in_bookmarks=True)
+        UserBookRelation.objects.create(
+            user=self.user1, book=self.book2, like=False)
+        UserBookRelation.objects.create(
+            user=other, book=self.book2, in_bookmarks=True, like=True)
+
+        self.client.force_login(self.user1)
+        response = self.client.get(reverse('userbookrelation-bookmarks'),
+                                   data={'page_size': 1})
+        books = response.data['results']
+        response = self.client.get(response.data['next'])
+        books += response.data['results']
+
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            BookValuesSerializer(BookValuesSerializer.get_queryset(
+                get_books_queryset().filter(pk__in=[
+                    self.book1.pk, self.book3.pk])), many=True).data,
+            books)
+
+        response = self.client.get(reverse('userbookrelation-likes'))
+        self.assertEqual([self.book3.pk],
+                         [book['id'] for book in response.data['results']])
+
+    def test_bookmarks_anonymous(self):
+        response = self.client.get(reverse('userbookrelation-bookmarks'))
+
+        self.assertEqual(HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_bulk_not_list(self):
+        url = reverse('userbookrelation-bulk')
+
+        self.client.force_login(self.user1)
+        response = self.client.post(
+            url, data=dumps({'book': self.book1.pk}),
+            content_type='application/json')
+
+        self.assertEqual(HTTP_400_BAD_REQUEST, response.status_code)
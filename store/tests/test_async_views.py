@@ -0,0 +1,139 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.models import Author
+from store.models import Book
+from store.models import UserBookRelation
+from store.writebehind import get_pending
+from store.writebehind import relation_buffer
+
+
+class AsyncViewsTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='Test User', first_name='First', last_name='Last')
+        self.book1 = Book.objects.create(
+            name='Test', price=434.99, author_name='Author 1', owner=self.user)
+        self.book2 = Book.objects.create(
+            name='Test book 2', price=45, author_name='Author 2')
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book1, like=True, rate=4)
+        self.async_client.force_login(self.user)
+
+    async def test_list_matches_sync(self):
+        params = {'ordering': '-price', 'page_size': 1}
+        response = await self.async_client.get(
+            reverse('async-book-list'), params)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        sync_data = (await sync_to_async(APIClient().get)(
+            reverse('book-list'), params)).json()
+        self.assertEqual(sync_data['results'], data['results'])
+
+        response = await self.async_client.get(data['next'])
+        self.assertEqual([self.book2.pk],
+                         [book['id'] for book in response.json()['results']])
+
+    async def test_list_invalid_params(self):
+        for params, status in (({'cursor': 'garbage'}, 404),
+                               ({'fields': 'garbage'}, 400)):
+            response = await self.async_client.get(
+                reverse('async-book-list'), params)
+            sync_response = await sync_to_async(APIClient().get)(
+                reverse('book-list'), params)
+
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response.json(), sync_response.json())
+
+    async def test_detail(self):
+        response = await self.async_client.get(
+            reverse('async-book-detail', kwargs={'pk': self.book1.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['likes'], 1)
+        self.assertEqual(response.json()['readers'],
+                         [{'first_name': 'First', 'last_name': 'Last'}])
+
+        response = await self.async_client.get(
+            reverse('async-book-detail', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_relation_update(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book2.pk,))
+
+        response = await self.async_client.patch(
+            url, {'like': True, 'rate': 5}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'book': self.book2.pk, 'like': True, 'in_bookmarks': False,
+            'rate': 5})
+        book = await Book.objects.aget(pk=self.book2.pk)
+        self.assertEqual(book.readers_count, 1)
+        self.assertEqual(book.likes_count, 1)
+        self.assertEqual(book.rating_sum, 5)
+        author = await Author.objects.aget(name='Author 2')
+        self.assertEqual(author.rating_count, 1)
+
+        response = await self.async_client.patch(
+            url, {'like': False}, content_type='application/json')
+
+        self.assertEqual(response.json()['rate'], 5)
+        book = await Book.objects.aget(pk=self.book2.pk)
+        self.assertEqual(book.likes_count, 0)
+        self.assertEqual(book.rating_count, 1)
+
+    @override_settings(STORE_RELATION_WRITE_BEHIND=True,
+                       STORE_RELATION_FLUSH_INTERVAL=0)
+    async def test_relation_update_write_behind(self):
+        await sync_to_async(cache.clear)()
+        url = reverse('async-userbookrelation-detail', args=(self.book2.pk,))
+
+        response = await self.async_client.patch(
+            url, {'like': True, 'rate': 5}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {
+            'book': self.book2.pk, 'like': True, 'in_bookmarks': False,
+            'rate': 5})
+        relation = await UserBookRelation.objects.aget(
+            user=self.user, book=self.book2)
+        self.assertFalse(relation.like)
+        self.assertEqual(relation.rate, 5)
+        self.assertEqual(
+            await sync_to_async(get_pending)(self.user.pk, self.book2.pk),
+            {'like': True})
+
+        await sync_to_async(relation_buffer.flush)()
+
+        book = await Book.objects.aget(pk=self.book2.pk)
+        self.assertEqual(book.likes_count, 1)
+
+    async def test_relation_update_invalid(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book2.pk,))
+
+        response = await self.async_client.patch(
+            url, {'rate': 6}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('rate', response.json())
+
+        response = await self.async_client.patch(
+            reverse('async-userbookrelation-detail', args=(0,)),
+            {'like': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_relation_update_anonymous(self):
+        self.async_client.cookies.clear()
+        url = reverse('async-userbookrelation-detail', args=(self.book2.pk,))
+
+        response = await self.async_client.patch(
+            url, {'like': True}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,234 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db import transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from store.cache import bump_books_version
+from store.cache import user_cache_key
+from store.cache import get_books_version
+from store.cache import get_or_build
+from store.models import Book
+from store.models import UserBookRelation
+
+
+class BooksCacheTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1', owner=self.user)
+
+    def test_list_cached(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'ordering': 'price'})
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url, data={'ordering': 'price'})
+
+        self.assertEqual(response.data, cached_response.data)
+
+    @override_settings(STORE_RESPONSE_CACHE=False)
+    def test_response_cache_off(self):
+        url = reverse('book-list')
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        self.assertGreater(len(queries), 0)
+
+    def test_detail_invalidated_by_relation(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        self.assertEqual(self.client.get(url).data['likes'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(
+                user=self.user, book=self.book, like=True)
+
+        self.assertEqual(self.client.get(url).data['likes'], 1)
+
+    def test_version_bump(self):
+        version = get_books_version()
+        bump_books_version()
+        self.assertEqual(get_books_version(), version + 1)
+
+        cache.delete('store:books:version')
+        self.assertGreater(get_books_version(), version + 1)
+
+    def test_version_bumped_on_commit(self):
+        version = get_books_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                UserBookRelation.objects.create(
+                    user=self.user, book=self.book, like=True)
+                self.assertEqual(get_books_version(), version)
+
+        self.assertEqual(get_books_version(), version + 1)
+
+    def test_stale_served_while_rebuilding(self):
+        get_or_build('key', lambda: 'old')
+        bump_books_version()
+        cache.add('key:lock', 1)
+
+        self.assertEqual(get_or_build('key', lambda: 'new'), 'old')
+
+        cache.delete('key:lock')
+        self.assertEqual(get_or_build('key', lambda: 'new'), 'new')
+
+
+class BooksConditionalGetTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1', owner=self.user)
+
+    def test_list_not_modified(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, data={'ordering': 'price'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(
+                user=self.user, book=self.book, like=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_not_modified_since(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_not_modified(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(
+                user=self.user, book=self.book, rate=5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rating'], '5.00')
+
+    def test_detail_modified_within_second(self):
+        other = User.objects.create(username='Other User')
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book, like=True)
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(
+                user=other, book=self.book, like=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes'], 2)
+
+    def test_detail_owner_renamed(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        etag = self.client.get(url)['ETag']
+
+        self.user.last_login = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.user.username = 'Renamed User'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['owner_name'], 'Renamed User')
+
+    def test_detail_missing(self):
+        url = reverse('book-detail', kwargs={'pk': 0})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"anything"')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AuthCacheTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1', owner=self.user)
+        self.client.force_login(self.user)
+
+    def assertNoAuthQueries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 300)
+        for query in queries:
+            self.assertNotIn('"django_session"', query['sql'])
+            self.assertNotIn('FROM "auth_user"', query['sql'])
+        return response
+
+    def test_steady_state(self):
+        list_url = reverse('book-list')
+        self.client.get(list_url)
+
+        with self.assertNumQueries(0):
+            self.client.get(list_url)
+
+        self.assertNoAuthQueries(
+            'patch', reverse('book-detail', kwargs={'pk': self.book.pk}),
+            data={'price': '12.00'}, format='json')
+        self.assertNoAuthQueries(
+            'patch', reverse('userbookrelation-detail', args=(self.book.pk,)),
+            data={'like': True}, format='json')
+        self.assertNoAuthQueries(
+            'get', reverse('userbookrelation-likes'))
+
+    def test_user_change_invalidates(self):
+        self.client.get(reverse('book-list'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+    def test_password_change_logs_out(self):
+        self.client.get(reverse('book-list'))
+
+        self.user.set_password('new password')
+        self.user.save()
+        response = self.client.patch(
+            reverse('userbookrelation-detail', args=(self.book.pk,)),
+            data={'like': True}, format='json')
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_logout(self):
+        self.client.get(reverse('book-list'))
+
+        self.client.logout()
+
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
@@ -0,0 +1,111 @@
+import re
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework.utils.json import dumps
+
+from store.logic import rebuild_book_counters
+from store.models import Book
+from store.models import UserBookRelation
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is SQLite specific')
+class QueryPlanTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f'user{i}') for i in range(1000))
+        books = Book.objects.bulk_create(
+            Book(name=f'Book {i}', price=i % 50, author_name=f'Author {i % 30}',
+                 owner=cls.users[i % 20])
+            for i in range(500))
+        UserBookRelation.objects.bulk_create(
+            UserBookRelation(user=user, book=book, like=book.pk % 2 == 0,
+                             in_bookmarks=book.pk % 3 == 0, rate=book.pk % 5 + 1)
+            for book in books for user in cls.users[book.pk % 50::50])
+        rebuild_book_counters()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertIndexed(self, queries):
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+
+            # A bare SCAN is only fine when walking the rowid order of the
+            # table up to a LIMIT, which is what ORDER BY id pages do, and
+            # only relevance ordering may sort the (already matched) rows.
+            walks_pk = 'WHERE' not in sql and 'LIMIT' in sql
+            ranked = 'ORDER BY "search_rank"' in sql
+            for step in plan:
+                table = re.match(r'(SCAN|SEARCH) (store_|auth_)', step)
+                if table and (table[1] == 'SEARCH' or not walks_pk):
+                    self.assertRegex(step, 'USING|VIRTUAL TABLE INDEX',
+                                     msg=f'{sql}\n{plan}')
+                if not ranked:
+                    self.assertNotIn('TEMP B-TREE', step,
+                                     msg=f'{sql}\n{plan}')
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data=params)
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def test_book_list(self):
+        url = reverse('book-list')
+        for params in ({}, {'price': 10}, {'ordering': 'price'},
+                       {'ordering': '-price'}, {'ordering': 'author_name'},
+                       {'ordering': '-author_name'}, {'search': 'Author 1'}):
+            response, queries = self.get(url, page_size=5, **params)
+            self.assertIndexed(queries)
+
+            _, queries = self.get(response.data['next'])
+            self.assertIndexed(queries)
+
+    def test_leaderboards(self):
+        for url_name in ('book-most-liked', 'book-top-rated'):
+            response, queries = self.get(reverse(url_name), page_size=5)
+            self.assertIndexed(queries)
+
+            _, queries = self.get(response.data['next'])
+            self.assertIndexed(queries)
+
+    def test_user_lists(self):
+        self.client.force_login(self.users[0])
+        for url_name in ('userbookrelation-bookmarks',
+                         'userbookrelation-likes'):
+            response, queries = self.get(reverse(url_name), page_size=2)
+            self.assertIndexed(queries)
+
+            _, queries = self.get(response.data['next'])
+            self.assertIndexed(queries)
+
+    def test_book_detail(self):
+        book = Book.objects.first()
+        _, queries = self.get(reverse('book-detail', kwargs={'pk': book.pk}))
+        self.assertIndexed(queries)
+
+    def test_relation_update(self):
+        book = Book.objects.last()
+        self.client.force_login(self.users[0])
+        url = reverse('userbookrelation-detail', args=(book.pk,))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(url, data=dumps({'like': True, 'rate': 5}),
+                              content_type='application/json')
+
+        self.assertIndexed(queries)
@@ -1,6 +1,25 @@
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+from store.cache import get_rating_prior
+from store.logic import bulk_upsert_relations
 from store.logic import operations
+from store.models import Author
+from store.models import Book
+from store.models import UserBookRelation
+from store.serializer import get_rating_histograms
 
 
 class LogicTestCase(TestCase):
@@ -24,3 +43,187 @@ class LogicTestCase(TestCase):
     def test_unknown(self):
         result = operations(6, 2, '')
         self.assertEqual(result, 'Operation unknown')
+
+
+class BookCountersTestCase(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1')
+
+    def test_create(self):
+        UserBookRelation.objects.create(
+            user=self.user1, book=self.book, like=True, rate=5)
+        UserBookRelation.objects.create(
+            user=self.user2, book=self.book, like=False, rate=4)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.likes_count, 1)
+        self.assertEqual(self.book.rating_sum, 9)
+        self.assertEqual(self.book.rating_count, 2)
+        self.assertEqual(self.book.rating, Decimal('4.50'))
+
+    def test_update_and_delete(self):
+        relation = UserBookRelation.objects.create(
+            user=self.user1, book=self.book, like=True, rate=5)
+
+        relation = UserBookRelation.objects.get(pk=relation.pk)
+        relation.like = False
+        relation.rate = 2
+        relation.save()
+        relation.save()
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.likes_count, 0)
+        self.assertEqual(self.book.rating_sum, 2)
+        self.assertEqual(self.book.rating_count, 1)
+
+        relation.delete()
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, 0)
+        self.assertIsNone(self.book.rating)
+
+    def test_book_delete(self):
+        for user in (self.user1, self.user2):
+            UserBookRelation.objects.create(
+                user=user, book=self.book, like=True, rate=4)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.book.delete()
+
+        # No counter UPDATE per relation, the author is recounted once
+        updates = [query['sql'].split()[1] for query in queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(['"store_author"'], updates)
+        author = Author.objects.get(name='Author 1')
+        self.assertEqual((0, 0), (author.books_count, author.rating_count))
+
+    def test_rebuild_command(self):
+        UserBookRelation.objects.create(
+            user=self.user1, book=self.book, like=True, rate=3)
+        Book.objects.update(likes_count=10, rating_sum=0, rating_count=0,
+                            rating=None)
+
+        Author.objects.update(books_count=0, rating=None)
+
+        call_command('rebuild_book_counters', stdout=StringIO())
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.likes_count, 1)
+        self.assertEqual(self.book.rating_sum, 3)
+        self.assertEqual(self.book.rating_count, 1)
+        self.assertEqual(self.book.rating, Decimal('3.00'))
+        self.assertEqual((1, Decimal('3.00')),
+                         (self.book.author.books_count, self.book.author.rating))
+
+    @override_settings(STORE_RATING_MIN_VOTES=2, STORE_RATING_PRIOR=3.0)
+    def test_rating_score(self):
+        cache.clear()
+        other = Book.objects.create(
+            name='Other', price=10, author_name='Author 2')
+        UserBookRelation.objects.create(
+            user=self.user1, book=self.book, rate=5)
+        UserBookRelation.objects.create(
+            user=self.user1, book=other, rate=1)
+        UserBookRelation.objects.create(
+            user=self.user2, book=other, rate=2)
+
+        self.book.refresh_from_db()
+        self.assertAlmostEqual(self.book.rating_score, (5 + 2 * 3) / 3)
+
+        call_command('rebuild_rating_scores', stdout=StringIO())
+
+        self.book.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(get_rating_prior(), 8 / 3)
+        self.assertAlmostEqual(self.book.rating_score, (5 + 2 * 8 / 3) / 3)
+        self.assertAlmostEqual(other.rating_score, (3 + 2 * 8 / 3) / 4)
+
+    def test_rating_histogram_invalidated(self):
+        cache.clear()
+        histogram = get_rating_histograms([self.book.pk])[self.book.pk]
+        self.assertEqual(0, histogram['4'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_upsert_relations(self.user1, {self.book.pk: {'rate': 4}})
+        histogram = get_rating_histograms([self.book.pk])[self.book.pk]
+        self.assertEqual(1, histogram['4'])
+
+        # Likes leave the cached histogram alone
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_upsert_relations(self.user1, {self.book.pk: {'like': True}})
+        with self.assertNumQueries(0):
+            get_rating_histograms([self.book.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.filter(user=self.user1).delete()
+        histogram = get_rating_histograms([self.book.pk])[self.book.pk]
+        self.assertEqual(0, histogram['4'])
+
+
+class ImportBooksTestCase(TestCase):
+
+    def test_import_command(self):
+        user = User.objects.create(username='publisher')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('name,price,author_name\nBook 1,5,Author 1\n'
+                       'Book 2,,Author 2\n')
+            file.flush()
+            stderr = StringIO()
+
+            call_command('import_books', file.name, owner='publisher',
+                         stdout=StringIO(), stderr=stderr)
+
+        book = Book.objects.get()
+        self.assertEqual((book.name, book.owner), ('Book 1', user))
+        self.assertIn('line 3: {"price"', stderr.getvalue())
+
+
+class SeedStoreTestCase(TestCase):
+
+    def test_seed(self):
+        call_command('seed_store', users=50, books=40, relations=400,
+                     batch_size=64, seed=1, stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(UserBookRelation.objects.count(), 400)
+        self.assertEqual(
+            Book.objects.aggregate(total=Sum('readers_count'))['total'], 400)
+
+        # Power-law popularity: the top 10% of books hold a large share
+        readers = sorted(
+            Book.objects.values_list('readers_count', flat=True), reverse=True)
+        self.assertGreater(sum(readers[:4]), 400 * 0.3)
+
+    def test_seed_twice(self):
+        # More authors than the batch size, on top of existing books
+        options = {'users': 20, 'books': 40, 'relations': 100,
+                   'batch_size': 5, 'stdout': StringIO()}
+        call_command('seed_store', seed=1, **options)
+        first_ids = list(Book.objects.values_list('pk', flat=True))
+
+        call_command('seed_store', seed=2, **options)
+
+        self.assertEqual(UserBookRelation.objects.filter(
+            book_id__in=first_ids).count(), 100)
+        self.assertEqual(UserBookRelation.objects.exclude(
+            book_id__in=first_ids).count(), 100)
+
+    def test_too_many_relations(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_store', users=2, books=2, relations=3,
+                         stdout=StringIO())
+
+    def test_bench_endpoints(self):
+        stdout = StringIO()
+        call_command('bench_endpoints', relations=[200], repeat=1,
+                     stdout=stdout)
+
+        scale, = json.loads(stdout.getvalue())['scales']
+        for result in scale['results']:
+            self.assertLess(max(result['statuses']), 400, result['name'])
+            self.assertGreater(result['queries'], 0, result['name'])
+        self.assertFalse(Book.objects.exists())
@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase
+
+from store.models import Book
+
+
+def get_sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1', owner=self.user)
+
+    def test_route_metrics(self):
+        labels = {'route': 'book-detail', 'method': 'GET'}
+        requests = get_sample('store_request_queries_count', **labels)
+        queries = get_sample('store_request_queries_sum', **labels)
+        ok = get_sample('store_request_latency_seconds_count',
+                        status='200', **labels)
+
+        self.client.get(reverse('book-detail', kwargs={'pk': self.book.pk}))
+
+        self.assertEqual(
+            get_sample('store_request_queries_count', **labels), requests + 1)
+        self.assertEqual(
+            get_sample('store_request_queries_sum', **labels), queries + 3)
+        self.assertEqual(get_sample('store_request_latency_seconds_count',
+                                    status='200', **labels), ok + 1)
+        self.assertGreater(
+            get_sample('store_request_db_seconds_sum', **labels), 0)
+
+    def test_unresolved(self):
+        before = get_sample('store_request_queries_count',
+                            route='unresolved', method='GET')
+
+        self.client.get('/no-such-page/')
+
+        self.assertEqual(get_sample('store_request_queries_count',
+                                    route='unresolved', method='GET'),
+                         before + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('book-list'))
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'store_request_queries_bucket{le="2.0",'
+                      b'method="GET",route="book-list"}', response.content)
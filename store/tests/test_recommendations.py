@@ -0,0 +1,85 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.status import HTTP_200_OK
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.models import UserBookRelation
+from store.recommendations import build_similar_books
+from store.recommendations import similar_books
+from store.recommendations import SimilarBooks
+
+
+class SimilarBooksTestCase(APITestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'similar_books.npz')
+        settings = override_settings(STORE_SIMILAR_BOOKS_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.users = [User.objects.create(username=f'user{i}')
+                      for i in range(4)]
+        self.books = [Book.objects.create(
+            name=f'Book {i}', price=10, author_name='Author')
+            for i in range(4)]
+        for user, book, fields in [
+                (0, 0, {'like': True}), (0, 1, {'like': True}),
+                (1, 0, {'like': True}), (1, 1, {'rate': 4}),
+                (1, 2, {'like': True}), (2, 2, {'rate': 5}),
+                (2, 3, {'like': True}), (3, 0, {'rate': 2})]:
+            UserBookRelation.objects.create(
+                user=self.users[user], book=self.books[book], **fields)
+
+    def get_similar(self, book, **params):
+        url = reverse('book-similar', kwargs={'pk': book.pk})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, data=params)
+        self.assertEqual(HTTP_200_OK, response.status_code)
+        return response.data['results']
+
+    def test_similar(self):
+        self.assertEqual([], self.get_similar(self.books[0]))
+
+        call_command('rebuild_similar_books', stdout=StringIO())
+
+        self.assertEqual([
+            {'id': self.books[1].pk, 'score': 1.0},
+            {'id': self.books[2].pk, 'score': 0.5},
+        ], self.get_similar(self.books[0]))
+        self.assertEqual([{'id': self.books[1].pk, 'score': 1.0}],
+                         self.get_similar(self.books[0], limit=1))
+        self.assertEqual([{'id': self.books[2].pk, 'score': 0.7071}],
+                         self.get_similar(self.books[3]))
+
+    def test_refresh(self):
+        Book.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        call_command('rebuild_similar_books', stdout=StringIO())
+        UserBookRelation.objects.create(
+            user=self.users[2], book=self.books[0], like=True)
+        relation = UserBookRelation.objects.get(
+            user=self.users[0], book=self.books[1])
+        relation.like = False
+        relation.save()
+
+        out = StringIO()
+        call_command('rebuild_similar_books', '--refresh', stdout=out)
+
+        self.assertIn('Refreshed 2 changed books', out.getvalue())
+        refreshed = SimilarBooks.load(self.path)
+        rebuilt = build_similar_books()
+        for book in self.books:
+            self.assertEqual(rebuilt.get(book.pk), refreshed.get(book.pk))
+        self.assertEqual(rebuilt.get(self.books[0].pk),
+                         self.get_similar(self.books[0]))
+        self.assertIs(similar_books.get(), similar_books.get())
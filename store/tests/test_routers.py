@@ -0,0 +1,124 @@
+from contextlib import ExitStack
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.db import router
+from django.test import SimpleTestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import APITestCase
+
+from store.cache import make_request_key
+from store.middleware import REPLICA_PIN_COOKIE
+from store.models import Book
+from store.routers import replica_state
+from store.routers import ReplicaState
+
+
+@override_settings(STORE_REPLICA_DATABASES=['replica0', 'replica1'])
+class ReplicaRouterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.state = ReplicaState()
+        self.token = replica_state.set(self.state)
+
+    def tearDown(self):
+        replica_state.reset(self.token)
+
+    def test_replica_reads(self):
+        self.state.use_replica = True
+
+        self.assertIn(router.db_for_read(Book), ['replica0', 'replica1'])
+        self.assertEqual(router.db_for_read(User), 'default')
+        self.assertEqual(router.db_for_write(Book), 'default')
+        self.assertEqual(router.db_for_read(Book), 'default')
+
+    def test_not_allowed(self):
+        self.assertEqual(router.db_for_read(Book), 'default')
+
+    def test_replica_entries_kept_apart(self):
+        # A pinned client is never served what a lagging replica returned
+        request = Request(APIRequestFactory().get('/book/'))
+        primary_key = make_request_key('store:books:list', request)
+
+        self.state.use_replica = True
+        replica_key = make_request_key('store:books:list', request)
+        self.state.wrote = True
+
+        self.assertNotEqual(replica_key, primary_key)
+        self.assertEqual(
+            make_request_key('store:books:list', request), primary_key)
+
+    def test_no_migrations(self):
+        self.assertFalse(router.allow_migrate('replica0', 'store'))
+        self.assertTrue(router.allow_migrate('default', 'store'))
+
+
+class ReplicaPinApiTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='Test User')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1')
+        self.client.force_authenticate(self.user)
+
+    def test_pinned_after_write(self):
+        url = reverse('userbookrelation-detail', args=(self.book.pk,))
+        response = self.client.get(url)
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+        response = self.client.patch(url, {'like': True}, format='json')
+        cookie = response.cookies[REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.STORE_REPLICA_PIN_SECONDS)
+
+
+# The other test cases only allow queries to default, so run this one on
+# its own: REPLICA_DATABASE_URLS=sqlite:////tmp/replica0.sqlite3
+# ./manage.py test store.tests.test_routers
+@skipUnless(settings.STORE_REPLICA_DATABASES,
+            'Set REPLICA_DATABASE_URLS to run against replicas')
+class ReplicaReadsTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User', is_staff=True)
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, method, url, **kwargs):
+        with ExitStack() as stack:
+            primary = stack.enter_context(
+                CaptureQueriesContext(connections['default']))
+            replicas = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.STORE_REPLICA_DATABASES]
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, len(primary), sum(map(len, replicas))
+
+    def test_read_your_writes(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        response, primary, replicas = self.count_queries('get', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replicas, 0)
+
+        response, _, replicas = self.count_queries(
+            'patch', url, data={'price': '12.00'}, format='json')
+        self.assertEqual(replicas, 0)
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+
+        response, primary, replicas = self.count_queries('get', url)
+        self.assertEqual(response.data['price'], '12.00')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replicas, 0)
@@ -0,0 +1,70 @@
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.search import restore_sqlite_triggers
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'),
+            'full-text search index is not available')
+class BookSearchTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.book1 = Book.objects.create(
+            name='War and Peace', price=20, author_name='Leo Tolstoy')
+        self.book2 = Book.objects.create(
+            name='Anna Karenina', price=15, author_name='Leo Tolstoy')
+        self.book3 = Book.objects.create(
+            name='Peace of Mind', price=10, author_name='Peace Pilgrim')
+
+    def search(self, term, **params):
+        response = self.client.get(
+            reverse('book-list'), data={'search': term, **params})
+        return [book['id'] for book in response.data['results']]
+
+    def test_search_all_terms(self):
+        self.assertEqual(self.search('tolstoy peace'), [self.book1.pk])
+
+    def test_search_prefix(self):
+        self.assertEqual(set(self.search('Tolst')),
+                         {self.book1.pk, self.book2.pk})
+
+    def test_search_ranked(self):
+        self.assertEqual(self.search('peace')[0], self.book3.pk)
+
+    def test_search_with_ordering(self):
+        self.assertEqual(self.search('peace', ordering='-price'),
+                         [self.book1.pk, self.book3.pk])
+
+    def test_search_paginated(self):
+        response = self.client.get(
+            reverse('book-list'), data={'search': 'leo', 'page_size': 1})
+        ids = [response.data['results'][0]['id']]
+        response = self.client.get(response.data['next'])
+        ids.append(response.data['results'][0]['id'])
+
+        self.assertEqual(set(ids), {self.book1.pk, self.book2.pk})
+
+    def test_index_follows_updates(self):
+        self.book2.name = 'Resurrection'
+        self.book2.save()
+        self.book3.delete()
+
+        self.assertEqual(self.search('resurrection'), [self.book2.pk])
+        self.assertEqual(self.search('mind'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_restore_sqlite_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER store_book_fts_ai')
+
+        restore_sqlite_triggers()
+        book = Book.objects.create(
+            name='Hadji Murat', price=5, author_name='Leo Tolstoy')
+
+        self.assertEqual(self.search('hadji'), [book.pk])
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 
 from store.models import Book, UserBookRelation
 from store.serializer import BooksSerializer
+from store.serializer import BookValuesSerializer
 from store.views import get_books_queryset
 
 
@@ -56,6 +57,7 @@ class BooksSerializerTestCase(TestCase):
                 'likes': 3,
                 'rating': '4.67',
                 'owner_name': 'testuser1',
+                'readers_count': 3,
                 'readers': [
                     {
                         'first_name': 'first_name1',
@@ -79,6 +81,7 @@ class BooksSerializerTestCase(TestCase):
                 'likes': 2,
                 'rating': '3.50',
                 'owner_name': 'testuser2',
+                'readers_count': 3,
                 'readers': [
                     {
                         'first_name': 'first_name1',
@@ -98,3 +101,45 @@ class BooksSerializerTestCase(TestCase):
         ]
 
         self.assertEqual(data, expected_data)
+
+
+class BookValuesSerializerTestCase(TestCase):
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'testuser{i}', first_name=f'first_name{i}',
+                last_name=f'last_name{i}')
+            for i in range(3)]
+
+        self.book1 = Book.objects.create(
+            name='Test', price=434.99, author_name='Test Author',
+            owner=self.users[0])
+        self.book2 = Book.objects.create(
+            name='Test book 2', price=45, author_name='Test Author')
+        self.book3 = Book.objects.create(
+            name='Test book 3', price=5.5, author_name='Test Author 2',
+            owner=self.users[1])
+
+        for user, like, rate in zip(self.users, (True, False, True),
+                                    (5, None, 4)):
+            UserBookRelation.objects.create(
+                book=self.book1, user=user, like=like, rate=rate)
+        UserBookRelation.objects.create(
+            book=self.book3, user=self.users[2], in_bookmarks=True)
+
+    def test_list_equivalent(self):
+        books = get_books_queryset()
+        rows = BookValuesSerializer.get_queryset(books)
+
+        self.assertEqual(
+            BooksSerializer(books, many=True).data,
+            BookValuesSerializer(rows, many=True).data)
+
+    def test_single_equivalent(self):
+        book = get_books_queryset().get(pk=self.book1.pk)
+        row = BookValuesSerializer.get_queryset(
+            get_books_queryset()).get(pk=self.book1.pk)
+
+        self.assertEqual(BooksSerializer(book).data,
+                         BookValuesSerializer(row).data)
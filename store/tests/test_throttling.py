@@ -0,0 +1,195 @@
+import threading
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.status import HTTP_200_OK
+from rest_framework.status import HTTP_201_CREATED
+from rest_framework.status import HTTP_429_TOO_MANY_REQUESTS
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.throttling import SlidingWindowRateThrottle
+from store.throttling import UserWriteRateThrottle
+from store.views import UserBookRelationViewSet
+
+RATES = {
+    'relation_user': '4/min',
+    'relation_ip': '10/min',
+    'book_create_user': '2/hour',
+    'book_create_ip': '10/hour',
+}
+
+
+@override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': RATES})
+class SlidingWindowThrottleTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Start of a one minute window
+        self.now = 600.0
+        self.view = UserBookRelationViewSet()
+        self.request = self.make_request('patch')
+
+    def make_request(self, method):
+        request = Request(getattr(APIRequestFactory(), method)('/'))
+        request.user = User(pk=1)
+        return request
+
+    def allow(self, count, request=None):
+        results = []
+        for _ in range(count):
+            throttle = UserWriteRateThrottle()
+            throttle.timer = lambda: self.now
+            results.append(throttle.allow_request(
+                request or self.request, self.view))
+        return results, throttle
+
+    def test_sliding_window(self):
+        results, throttle = self.allow(6)
+
+        self.assertEqual(results, [True] * 4 + [False] * 2)
+        # The next window, once a quarter of it has passed
+        self.assertEqual(throttle.wait(), 75)
+
+        self.now += 74
+        self.assertEqual(self.allow(1)[0], [False])
+        self.now += 1
+        self.assertEqual(self.allow(2)[0], [True, False])
+
+    def test_safe_methods(self):
+        self.allow(4)
+
+        results, _ = self.allow(3, self.make_request('get'))
+
+        self.assertEqual(results, [True] * 3)
+
+    def test_no_lost_updates(self):
+        # Workers sharing the cache never let more than the rate through
+        results = []
+
+        def worker():
+            results.extend(self.allow(25)[0])
+
+        rates = {**RATES, 'relation_user': '50/min'}
+        with override_settings(
+                REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(results), 200)
+        self.assertEqual(results.count(True), 50)
+
+
+@override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': RATES})
+class ThrottleApiTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1')
+        self.url = reverse('userbookrelation-detail', args=(self.book.pk,))
+        self.client.force_authenticate(self.user)
+
+    def test_relation_writes(self):
+        for like in (True, False, True, False):
+            response = self.client.patch(self.url, {'like': like},
+                                         format='json')
+            self.assertEqual(response.status_code, HTTP_200_OK)
+
+        response = self.client.post(reverse('userbookrelation-bulk'),
+                                    [{'book': self.book.pk, 'like': True}],
+                                    format='json')
+
+        self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.client.get(self.url).status_code, HTTP_200_OK)
+
+    def test_relation_writes_per_ip(self):
+        for index in range(3):
+            self.client.force_authenticate(
+                User.objects.create(username=f'Bot {index}'))
+            for _ in range(4):
+                response = self.client.patch(self.url, {'like': True},
+                                             format='json')
+
+        # Ten of the twelve fit the IP's rate
+        self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    def test_book_create(self):
+        data = {'name': 'New', 'price': '10.00', 'author_name': 'Author 1'}
+        for _ in range(2):
+            response = self.client.post(reverse('book-list'), data,
+                                        format='json')
+            self.assertEqual(response.status_code, HTTP_201_CREATED)
+
+        response = self.client.post(reverse('book-list'), data, format='json')
+        self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+
+        response = self.client.patch(
+            reverse('book-detail', args=(self.book.pk,)),
+            {'price': '12.00'}, format='json')
+        self.assertNotEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+
+    async def test_async_relation_update(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        url = reverse('async-userbookrelation-detail', args=(self.book.pk,))
+
+        statuses = []
+        for _ in range(5):
+            response = await self.async_client.patch(
+                url, {'like': True}, content_type='application/json')
+            statuses.append(response.status_code)
+
+        self.assertEqual(statuses, [HTTP_200_OK] * 4 + [
+            HTTP_429_TOO_MANY_REQUESTS])
+        self.assertGreater(int(response['Retry-After']), 0)
+
+
+@override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {
+    **RATES, 'relation_user': '5/min', 'relation_ip': '40/min'}})
+class RelationWriteLoadTestCase(APITestCase):
+    # Bots behind one IP hammering like/unlike: the primary only sees the
+    # writes of the requests within the rate, rejected ones cost no query
+
+    def setUp(self):
+        cache.clear()
+        self.bots = [User.objects.create(username=f'Bot {index}')
+                     for index in range(20)]
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1')
+        self.url = reverse('userbookrelation-detail', args=(self.book.pk,))
+
+    def test_write_rate_bounded(self):
+        accepted = rejected = 0
+        # Frozen clock, the whole burst falls within one window
+        with mock.patch.object(SlidingWindowRateThrottle, 'timer',
+                               lambda self: 600.0):
+            for attempt in range(30):
+                for bot in self.bots:
+                    self.client.force_authenticate(bot)
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.patch(
+                            self.url, {'like': attempt % 2 == 0},
+                            format='json')
+                    if response.status_code == HTTP_429_TOO_MANY_REQUESTS:
+                        rejected += 1
+                        self.assertEqual(len(queries), 0)
+                    else:
+                        accepted += 1
+
+        self.assertEqual(accepted, 40)
+        self.assertEqual(rejected, 560)
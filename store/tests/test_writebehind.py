@@ -0,0 +1,126 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK
+from rest_framework.status import HTTP_202_ACCEPTED
+from rest_framework.status import HTTP_404_NOT_FOUND
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.models import UserBookRelation
+from store.writebehind import get_pending
+from store.writebehind import relation_buffer
+from store.writebehind import RelationBuffer
+
+
+@override_settings(STORE_RELATION_WRITE_BEHIND=True,
+                   STORE_RELATION_FLUSH_INTERVAL=0)
+class WriteBehindTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test User')
+        self.book = Book.objects.create(
+            name='Test', price=10, author_name='Author 1')
+        self.url = reverse('userbookrelation-detail', args=(self.book.pk,))
+        self.client.force_authenticate(self.user)
+
+    def test_toggles_coalesced(self):
+        for like in (True, False, True):
+            with self.assertNumQueries(2):
+                response = self.client.patch(
+                    self.url, {'like': like}, format='json')
+            self.assertEqual(response.status_code, HTTP_202_ACCEPTED)
+        self.client.patch(self.url, {'in_bookmarks': True}, format='json')
+
+        self.assertFalse(UserBookRelation.objects.exists())
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, {
+            'book': self.book.pk, 'like': True, 'in_bookmarks': True,
+            'rate': None})
+
+        self.assertEqual(relation_buffer.flush(), 1)
+
+        relation = UserBookRelation.objects.get()
+        self.assertTrue(relation.like)
+        self.assertTrue(relation.in_bookmarks)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.likes_count, 1)
+        self.assertEqual(get_pending(self.user.pk, self.book.pk), {})
+
+    def test_request_order_across_workers(self):
+        # Flushed by the second worker first, still the later toggle wins
+        first, second = RelationBuffer(), RelationBuffer()
+        first.add(self.user.pk, self.book.pk, {'like': True})
+        second.add(self.user.pk, self.book.pk, {'like': False})
+        self.assertEqual(get_pending(self.user.pk, self.book.pk),
+                         {'like': False})
+
+        second.flush()
+        first.flush()
+
+        self.assertFalse(UserBookRelation.objects.get().like)
+
+    def test_lists_see_other_workers(self):
+        RelationBuffer().add(self.user.pk, self.book.pk, {'like': True})
+
+        response = self.client.get(reverse('userbookrelation-likes'))
+
+        self.assertEqual([self.book.pk],
+                         [book['id'] for book in response.data['results']])
+
+    def test_rate_written_through(self):
+        response = self.client.patch(
+            self.url, {'like': True, 'rate': 4}, format='json')
+
+        self.assertEqual(response.status_code, HTTP_202_ACCEPTED)
+        relation = UserBookRelation.objects.get()
+        self.assertEqual(relation.rate, 4)
+        # The like is only buffered
+        self.assertFalse(relation.like)
+        self.assertEqual(response.data['like'], True)
+
+        response = self.client.patch(self.url, {'rate': 2}, format='json')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['rate'], 2)
+        self.assertEqual(response.data['like'], True)
+
+    def test_bulk_wins_over_buffered(self):
+        self.client.patch(self.url, {'like': True}, format='json')
+
+        self.client.post(reverse('userbookrelation-bulk'),
+                         [{'book': self.book.pk, 'like': False}],
+                         format='json')
+
+        self.assertEqual(relation_buffer.flush(), 0)
+        self.assertFalse(UserBookRelation.objects.get().like)
+        self.assertFalse(self.client.get(self.url).data['like'])
+
+    def test_likes_list_flushes(self):
+        self.client.patch(self.url, {'like': True}, format='json')
+
+        response = self.client.get(reverse('userbookrelation-likes'))
+
+        self.assertEqual([self.book.pk],
+                         [book['id'] for book in response.data['results']])
+
+    def test_shutdown_flush_waits(self):
+        # A flush while the flusher thread writes a batch returns only
+        # once that batch is in
+        with relation_buffer.flush_lock:
+            flush = threading.Thread(target=relation_buffer.flush)
+            flush.start()
+            flush.join(0.1)
+            self.assertTrue(flush.is_alive())
+        flush.join()
+
+    def test_missing_book(self):
+        url = reverse('userbookrelation-detail', args=(0,))
+
+        response = self.client.patch(url, {'like': True}, format='json')
+
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+        self.assertEqual(relation_buffer.flush(), 0)
@@ -0,0 +1,109 @@
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle without its read-modify-write: DRF keeps a list of
+    request times per client and writes it back with cache.set(), so
+    concurrent workers overwrite each other's requests. Here every client
+    has one counter per window, changed only with the atomic cache.add(),
+    incr() and decr(), and the rate is checked over a sliding window: the
+    previous window's count, weighted by how much of it still overlaps,
+    plus the current one. Workers share the limit only if they share the
+    cache, so CACHE_URL should point at memcached or redis.
+    """
+    cache_format = 'store:throttle:%(scope)s:%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        window, self.elapsed = divmod(self.timer(), self.duration)
+        key = f'{self.key}:{int(window)}'
+        self.previous = self.cache.get(f'{self.key}:{int(window) - 1}', 0)
+        self.current = self.increment(key)
+        if (self.previous * (1 - self.elapsed / self.duration) + self.current
+                <= self.num_requests):
+            return True
+
+        # Rejected requests don't use up the rate
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            pass
+        self.current -= 1
+        return False
+
+    def increment(self, key):
+        # Kept until the end of the next window, which weighs it
+        timeout = 2 * self.duration
+        if self.cache.add(key, 1, timeout):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.add(key, 1, timeout)
+            return 1
+
+    def wait(self):
+        # Seconds until one more request fits in the sliding window
+        allowed = self.num_requests - 1
+        remaining = self.duration - self.elapsed
+        if self.current > allowed:
+            # Only once the next window has moved far enough past this one
+            return remaining + self.duration * (1 - allowed / self.current)
+        return min(remaining, max(0, self.duration * (
+            1 - (allowed - self.current) / self.previous) - self.elapsed))
+
+
+class WriteRateThrottle(SlidingWindowRateThrottle):
+    # Throttles unsafe methods only, at the '<view.throttle_scope>_<kind>'
+    # rate of REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+    kind = None
+
+    def __init__(self):
+        # The rate depends on the view, see allow_request()
+        pass
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        self.scope = f'{view.throttle_scope}_{self.kind}'
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_rate(self):
+        # api_settings rather than the class attribute DRF reads at import,
+        # so rates follow override_settings()
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(
+                f'No default throttle rate set for {self.scope!r} scope')
+
+
+class UserWriteRateThrottle(WriteRateThrottle):
+    kind = 'user'
+
+    def get_cache_key(self, request, view):
+        # Anonymous writes are left to IPWriteRateThrottle
+        if not request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope, 'ident': request.user.pk}
+
+
+class IPWriteRateThrottle(WriteRateThrottle):
+    kind = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope, 'ident': self.get_ident(request)}
@@ -1,7 +1,10 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
+from .views import AuthorViewSet
 from .views import BookViewSet
+from .views import metrics_view
 from .views import oauth_view
 from .views import UserBookRelationViewSet
 
@@ -9,9 +12,16 @@ router = DefaultRouter()
 
 router.register(r'book', BookViewSet)
 router.register(r'book-relation', UserBookRelationViewSet)
+router.register(r'author', AuthorViewSet)
 
 urlpatterns = router.urls
 
 urlpatterns += [
         path('auth/', oauth_view, name='auth'),
+        path('metrics', metrics_view, name='metrics'),
+        path('async/book/', async_views.book_list, name='async-book-list'),
+        path('async/book/<int:pk>/', async_views.book_detail,
+             name='async-book-detail'),
+        path('async/book-relation/<int:book>/', async_views.relation_update,
+             name='async-userbookrelation-detail'),
         ]
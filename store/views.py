@@ -1,73 +1,527 @@
-from django.db.models import Count, Case, When, Avg
-from django.db.models import Prefetch
+import codecs
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import IntegerField
 from rest_framework.filters import OrderingFilter
-from rest_framework.filters import SearchFilter
 from rest_framework.mixins import UpdateModelMixin
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK
+from rest_framework.status import HTTP_202_ACCEPTED
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.viewsets import ModelViewSet
-from django.contrib.auth.models import User
+from rest_framework.viewsets import ReadOnlyModelViewSet
+from .cache import get_books_last_modified
+from .cache import get_books_version
+from .cache import get_or_build
+from .cache import make_request_key
+from .cache import request_digest
+from .importer import import_books
+from .importer import IMPORT_FORMATS
+from .logic import book_facets
+from .logic import bulk_upsert_relations
+from .logic import lock_user_relations
+from .metrics import render_metrics
+from .models import Author
 from .models import Book
 from .models import UserBookRelation
+from .pagination import KeysetPagination
+from .recommendations import similar_books
+from .search import BookSearchFilter
+from .serializer import AuthorSerializer
+from .serializer import BookReaderSerializer
 from .serializer import BooksSerializer
+from .serializer import BookValuesSerializer
 from .serializer import UserBookRelationsSerializer
+from .throttling import IPWriteRateThrottle
+from .throttling import UserWriteRateThrottle
+from .writebehind import get_pending
+from .writebehind import relation_buffer
+from .writebehind import TOGGLE_FIELDS
 from store.permissions import IsOwnerOrStaffOrReadOnly
 
 
+EXPORT_COLUMNS = ('id', 'name', 'price', 'author_name', 'likes', 'rating',
+                  'owner_name')
+# Books without an owner export '' as owner_name, as in the list
+EXPORT_VALUES = ('id', 'name', 'price', 'author_name', 'likes_count', 'rating',
+                 Coalesce('owner__username', Value('')))
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def render_ndjson(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_COLUMNS, row))) + '\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', render_ndjson),
+    'csv': ('text/csv', render_csv),
+}
+
+
+def books_list_etag(request, *args, **kwargs):
+    digest = request_digest(request, request.META.get('HTTP_ACCEPT'))
+    return f'"{get_books_version()}-{digest}"'
+
+
+def books_list_last_modified(request, *args, **kwargs):
+    return get_books_last_modified()
+
+
+def get_book_updated_at(request, pk):
+    if not hasattr(request, 'book_updated_at'):
+        request.book_updated_at = Book.objects.filter(pk=pk).values_list(
+            'updated_at', flat=True).first()
+    return request.book_updated_at
+
+
+def book_detail_etag(request, *args, pk=None, **kwargs):
+    updated_at = get_book_updated_at(request, pk)
+    if updated_at is None:
+        return None
+    digest = request_digest(request, request.META.get('HTTP_ACCEPT'))
+    # The version too, as the owner and readers are not part of the row
+    return f'"{get_books_version()}-{updated_at.timestamp()}-{digest}"'
+
+
+def book_detail_last_modified(request, *args, pk=None, **kwargs):
+    return get_book_updated_at(request, pk)
+
+
+# Leaderboard action: (filter, ordering) over precomputed Book columns,
+# each ordering backed by an index
+LEADERBOARDS = {
+    'most_liked': ({'likes_count__gt': 0}, ('-likes_count', '-id')),
+    'top_rated': ({'rating_score__isnull': False}, ('-rating_score', '-id')),
+}
+
+
 def get_books_queryset():
     return Book.objects.only(
             'id',
             'name',
             'price',
             'author_name',
+            'author_id',
+            'likes_count',
+            'rating',
+            'readers_count',
             'owner__username',
-            ).annotate(
-                likes=Count(
-                    Case(
-                        When(userbookrelation__like=True, then=1)
-                        )
-                    ),
-                rating=Avg('userbookrelation__rate')
-                ).select_related(
-                        'owner').prefetch_related(
-                        Prefetch(
-                            'readers',
-                            queryset=User.objects.only('first_name',
-                                                       'last_name'))).order_by('id')
+            ).select_related('owner').order_by('id')
 
 
 class BookViewSet(ModelViewSet):
     queryset = get_books_queryset()
+    # Safe methods may read from replicas, see store.middleware
+    use_read_replica = True
 
     permission_classes = [IsOwnerOrStaffOrReadOnly]
     serializer_class = BooksSerializer
+    pagination_class = KeysetPagination
+    lookup_value_regex = '[0-9]+'
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
 
-    filterset_fields = ['price',]
+    filterset_fields = {
+        'price': ['exact', 'gt', 'gte', 'lt', 'lte'],
+        'author': ['exact'],
+    }
     search_fields = ['name', 'author_name']
-    ordering_fields = ['price', 'author_name']
+    ordering_fields = ['id', 'price', 'author_name']
+
+    throttle_scope = 'book_create'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.get_serializer_class() is BookValuesSerializer:
+            queryset = BookValuesSerializer.get_queryset(
+                queryset,
+                BookValuesSerializer.get_requested_fields(self.request))
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve', *LEADERBOARDS):
+            return BookValuesSerializer
+        return super().get_serializer_class()
+
+    @method_decorator(condition(books_list_etag, books_list_last_modified))
+    def list(self, request, *args, **kwargs):
+        key = make_request_key('store:books:list', request)
+        return Response(get_or_build(
+            key, lambda: super(BookViewSet, self).list(
+                request, *args, **kwargs).data))
+
+    @method_decorator(condition(book_detail_etag, book_detail_last_modified))
+    def retrieve(self, request, *args, **kwargs):
+        key = make_request_key('store:books:detail', request, kwargs)
+        return Response(get_or_build(
+            key, lambda: super(BookViewSet, self).retrieve(
+                request, *args, **kwargs).data))
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [UserWriteRateThrottle(), IPWriteRateThrottle()]
+        return super().get_throttles()
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    @action(detail=False, methods=['get'], url_path='most-liked')
+    def most_liked(self, request):
+        return self.leaderboard(request)
+
+    @action(detail=False, methods=['get'], url_path='top-rated')
+    def top_rated(self, request):
+        return self.leaderboard(request)
+
+    def leaderboard(self, request):
+        lookups, ordering = LEADERBOARDS[self.action]
+
+        def build():
+            queryset = self.get_queryset().filter(**lookups).order_by(
+                *ordering)
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+
+        key = make_request_key(f'store:books:{self.action}', request)
+        return Response(get_or_build(key, build))
+
+    @action(detail=False, methods=['get'])
+    @method_decorator(condition(books_list_etag, books_list_last_modified))
+    def facets(self, request):
+        # Same filter and search parameters as the list, so the counts
+        # describe the books it returns. Each price bucket is drilled into
+        # with ?price__gte=<min>&price__lt=<max>.
+        key = make_request_key('store:books:facets', request)
+        return Response(get_or_build(key, lambda: book_facets(
+            self.filter_queryset(self.get_queryset()))))
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        # Served from the per-worker recommendations file, without a
+        # single query. Books missing from it have no neighbours yet.
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.STORE_SIMILAR_BOOKS_K))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        similar = similar_books.get()
+        results = [] if similar is None else similar.get(
+            int(pk), max(0, min(limit, settings.STORE_SIMILAR_BOOKS_K)))
+        return Response({'book': int(pk), 'results': results})
+
+    @action(detail=True, methods=['get'])
+    def readers(self, request, pk=None):
+        if not Book.objects.filter(pk=pk).exists():
+            raise NotFound()
+
+        relations = UserBookRelation.objects.filter(book_id=pk).select_related(
+            'user').only('user__first_name', 'user__last_name').order_by('id')
+        page = self.paginate_queryset(relations)
+        serializer = BookReaderSerializer(
+            [relation.user for relation in page], many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='import',
+            url_name='import', permission_classes=[IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['No file was submitted.']})
+
+        import_format = request.query_params.get(
+            'import_format', upload.name.rpartition('.')[2])
+        if import_format not in IMPORT_FORMATS:
+            raise ValidationError({'import_format': [
+                f'Expected one of: {", ".join(IMPORT_FORMATS)}.']})
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+
+        # Uploads past FILE_UPLOAD_MAX_MEMORY_SIZE are on disk already and
+        # are read line by line from there
+        lines = codecs.iterdecode(upload, 'utf-8')
+        try:
+            result = import_books(IMPORT_FORMATS[import_format](lines),
+                                  owner=request.user, dry_run=dry_run)
+        except UnicodeDecodeError:
+            raise ValidationError({'file': ['Expected UTF-8 text.']})
+        return Response(result)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': [
+                f'Expected one of: {", ".join(EXPORT_FORMATS)}.']})
+
+        rows = self.filter_queryset(self.get_queryset()).prefetch_related(
+            None).values_list(*EXPORT_VALUES)
+        # The rows are read after the view returns, outside of the request's
+        # replica routing, so the database is picked now.
+        rows = rows.using(rows.db).iterator(
+            chunk_size=settings.STORE_EXPORT_CHUNK_SIZE)
+
+        content_type, render = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            render(rows), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="books.{export_format}"')
+        return response
+
+
+class AuthorViewSet(ReadOnlyModelViewSet):
+    queryset = Author.objects.order_by('id')
+    # Safe methods may read from replicas, see store.middleware
+    use_read_replica = True
+
+    serializer_class = AuthorSerializer
+    pagination_class = KeysetPagination
+
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = {
+        'name': ['exact'],
+        'books_count': ['gte', 'lte'],
+    }
+    ordering_fields = ['id', 'name', 'books_count']
+
+    # Counters move with books and their ratings, hence the books version
+    def list(self, request, *args, **kwargs):
+        key = make_request_key('store:authors:list', request)
+        return Response(get_or_build(
+            key, lambda: super(AuthorViewSet, self).list(
+                request, *args, **kwargs).data))
+
+    def retrieve(self, request, *args, **kwargs):
+        key = make_request_key('store:authors:detail', request, kwargs)
+        return Response(get_or_build(
+            key, lambda: super(AuthorViewSet, self).retrieve(
+                request, *args, **kwargs).data))
+
 
 class UserBookRelationViewSet(UpdateModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
     queryset = UserBookRelation.objects.all()
     serializer_class = UserBookRelationsSerializer
+    pagination_class = KeysetPagination
     lookup_field = 'book'
+    lookup_value_regex = '[0-9]+'
+    # Writes only, see store.throttling
+    throttle_classes = [UserWriteRateThrottle, IPWriteRateThrottle]
+    throttle_scope = 'relation'
 
     def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(
-            user=self.request.user, book_id=self.kwargs['book'])
+        user = self.request.user
+        book_id = self.kwargs['book']
+        try:
+            return UserBookRelation.objects.get(user=user, book_id=book_id)
+        except UserBookRelation.DoesNotExist:
+            pass
+        # Counted on creation, so not alongside a bulk write of the user
+        with transaction.atomic():
+            lock_user_relations(user)
+            obj, _ = UserBookRelation.objects.get_or_create(
+                user=user, book_id=book_id)
         return obj
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Reloaded and locked, so concurrent writes of the relation take
+            # their counter deltas one after the other
+            serializer.instance = UserBookRelation.objects.select_for_update(
+                ).get(pk=serializer.instance.pk)
+            serializer.save()
+
+    def get_relation_state(self):
+        # The stored relation, or its defaults, with the toggles still in
+        # the write-behind buffer applied on top. Nothing is created.
+        user = self.request.user
+        book_id = int(self.kwargs['book'])
+        state = UserBookRelation.objects.filter(
+            user=user, book_id=book_id).values(
+                'book', 'like', 'in_bookmarks', 'rate').first()
+        if state is None:
+            if not Book.objects.filter(pk=book_id).exists():
+                raise NotFound()
+            state = {'book': book_id, 'like': False, 'in_bookmarks': False,
+                     'rate': None}
+        state.update(get_pending(user.pk, book_id))
+        return state
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_relation_state())
+
+    def partial_update(self, request, *args, **kwargs):
+        if not settings.STORE_RELATION_WRITE_BEHIND:
+            return super().partial_update(request, *args, **kwargs)
+
+        data = request.data
+        if isinstance(data, dict):
+            data = {key: value for key, value in data.items() if key != 'book'}
+        serializer = self.get_serializer(data=data, partial=True)
+        serializer.is_valid(raise_exception=True)
+
+        toggles = {field: value
+                   for field, value in serializer.validated_data.items()
+                   if field in TOGGLE_FIELDS}
+        written = {field: value
+                   for field, value in serializer.validated_data.items()
+                   if field not in TOGGLE_FIELDS}
+        if written:
+            # Ratings are not buffered and are written right away
+            serializer = self.get_serializer(
+                self.get_object(), data=written, partial=True)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+
+        state = self.get_relation_state()
+        if not toggles:
+            return Response(state, status=HTTP_200_OK)
+
+        relation_buffer.add(request.user.pk, state['book'], toggles)
+        state.update(toggles)
+        return Response(state, status=HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'])
+    def bookmarks(self, request):
+        return self.user_books(in_bookmarks=True)
+
+    @action(detail=False, methods=['get'])
+    def likes(self, request):
+        return self.user_books(like=True)
+
+    def user_books(self, **relation):
+        if settings.STORE_RELATION_WRITE_BEHIND:
+            # The lists include toggles queued by every worker
+            relation_buffer.flush()
+
+        # Paged over the relations in (book, id) order, which is the order
+        # of the partial (user, book) indexes, then reshaped into the rows
+        # BookValuesSerializer reads from get_books_queryset().
+        values = BookValuesSerializer.get_values(
+            BookValuesSerializer.get_requested_fields(self.request))
+        relations = UserBookRelation.objects.filter(
+            user=self.request.user, **relation).order_by('book_id').values(
+                'id', 'book_id', *(f'book__{field}' for field in values))
+        page = self.paginate_queryset(relations)
+        books = [{field: row[f'book__{field}'] for field in values}
+                 for row in page]
+        serializer = BookValuesSerializer(
+            books, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(items) > settings.STORE_RELATION_BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [
+                f'Ensure this list has no more than '
+                f'{settings.STORE_RELATION_BULK_MAX_ITEMS} items.']})
+
+        results, changes = self.validate_bulk_items(items)
+        if settings.STORE_RELATION_WRITE_BEHIND:
+            # Toggles queued before this request, by any worker, go first
+            relation_buffer.flush()
+        relations = bulk_upsert_relations(request.user, changes)
+
+        data = {
+            relation.book_id: self.get_serializer(relation).data
+            for relation in relations}
+        for result in results:
+            if 'errors' not in result:
+                result['data'] = data[result['book']]
+        return Response(results)
+
+    def validate_bulk_items(self, items):
+        # Validates every item like a partial update of its relation, but
+        # checks all the referenced books with a single query.
+        book_field = self.get_serializer().fields['book']
+        book_id_field = IntegerField()
+        results = []
+        changes = {}
+
+        for index, item in enumerate(items):
+            result = {'index': index}
+            results.append(result)
+            if not isinstance(item, dict):
+                result['errors'] = {'non_field_errors': ['Expected an object.']}
+                continue
+
+            serializer = self.get_serializer(
+                data={key: value for key, value in item.items()
+                      if key != 'book'}, partial=True)
+            errors = {} if serializer.is_valid() else dict(serializer.errors)
+            if 'book' not in item:
+                errors['book'] = [book_field.error_messages['required']]
+            else:
+                # The pk as PrimaryKeyRelatedField takes it: no booleans,
+                # no fractions
+                try:
+                    result['book'] = book_id_field.to_internal_value(
+                        item['book'])
+                except ValidationError:
+                    errors['book'] = [
+                        book_field.error_messages['incorrect_type'].format(
+                            data_type=type(item['book']).__name__)]
+
+            if errors:
+                result['errors'] = errors
+            else:
+                changes.setdefault(result['book'], {}).update(
+                    serializer.validated_data)
+
+        existing = set(Book.objects.filter(
+            pk__in=changes).values_list('pk', flat=True))
+        for result in results:
+            book_id = result.get('book')
+            if 'errors' not in result and book_id not in existing:
+                result['errors'] = {'book': [
+                    book_field.error_messages['does_not_exist'].format(
+                        pk_value=book_id)]}
+                changes.pop(book_id, None)
+
+        return results, changes
+
 
 def oauth_view(request):
     if request.user:
         print(request.user.username)
     return render(request, 'oauth.html')
+
+
+def metrics_view(request):
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
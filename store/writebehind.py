@@ -0,0 +1,159 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db import IntegrityError
+
+from .logic import bulk_upsert_relations
+
+logger = logging.getLogger(__name__)
+
+# Fields of UserBookRelation that STORE_RELATION_WRITE_BEHIND buffers
+TOGGLE_FIELDS = ('like', 'in_bookmarks')
+
+QUEUE_HEAD_KEY = 'store:relation:queue:head'
+QUEUE_TAIL_KEY = 'store:relation:queue:tail'
+QUEUE_LOCK_KEY = 'store:relation:queue:lock'
+# How long a drain waits for slots taken by add() but not stored yet
+SLOT_WAIT = 1.0
+
+
+def slot_key(slot: int) -> str:
+    return f'store:relation:queue:{slot}'
+
+
+def read_queue() -> tuple[int, int, dict]:
+    # (head, tail, {slot: (user id, book id, fields)}) of the toggles not
+    # drained yet. Slots up to head are drained, tail is the last taken.
+    head = cache.get(QUEUE_HEAD_KEY, 0)
+    tail = cache.get(QUEUE_TAIL_KEY, 0)
+    if head > tail:
+        # The tail was evicted and numbering started over
+        head = 0
+    keys = {slot_key(slot): slot for slot in range(head + 1, tail + 1)}
+    entries = cache.get_many(list(keys))
+    return head, tail, {keys[key]: entry for key, entry in entries.items()}
+
+
+def get_pending(user_id: int, book_id: int) -> dict:
+    # Queued toggles of the relation, whichever worker took them, applied
+    # in request order
+    pending = {}
+    for slot, (user, book, fields) in sorted(read_queue()[2].items()):
+        if user == user_id and book == book_id:
+            pending.update(fields)
+    return pending
+
+
+class RelationBuffer:
+    """
+    Queue of relation toggles shared by all workers through the cache.
+    Every toggle takes the next slot with the atomic cache.incr(), so slot
+    order is request order, and flush() writes the queued toggles with
+    bulk_upsert_relations() in that order: the last request wins whichever
+    worker took it. Every worker flushes from a background thread every
+    STORE_RELATION_FLUSH_INTERVAL seconds and once more when it exits, one
+    worker at a time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Held for a whole flush, so that the one at shutdown waits for the
+        # flusher thread's batch to commit
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.started = False
+
+    def add(self, user_id: int, book_id: int, fields: dict) -> None:
+        try:
+            slot = cache.incr(QUEUE_TAIL_KEY)
+        except ValueError:
+            cache.add(QUEUE_TAIL_KEY, 0, timeout=None)
+            slot = cache.incr(QUEUE_TAIL_KEY)
+        cache.set(slot_key(slot), (user_id, book_id, fields),
+                  timeout=settings.STORE_RELATION_PENDING_TIMEOUT)
+
+        with self.lock:
+            if not self.started:
+                self.start()
+
+        if slot % settings.STORE_RELATION_FLUSH_MAX_PENDING == 0:
+            self.wakeup.set()
+
+    def start(self) -> None:
+        self.started = True
+        atexit.register(self.flush)
+        # An interval of 0 leaves flushing to explicit flush() calls
+        if settings.STORE_RELATION_FLUSH_INTERVAL > 0:
+            threading.Thread(target=self.run, name='store-relation-flusher',
+                             daemon=True).start()
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait(settings.STORE_RELATION_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                # Another worker draining already does the job
+                self.flush(wait=False)
+            except Exception:
+                logger.exception('Could not flush buffered relation changes')
+
+    def flush(self, wait: bool = True) -> int:
+        # With wait, every toggle queued before the call is written when it
+        # returns
+        with self.flush_lock:
+            if not self.acquire(wait):
+                return 0
+            try:
+                return self.drain()
+            finally:
+                cache.delete(QUEUE_LOCK_KEY)
+
+    def acquire(self, wait: bool) -> bool:
+        deadline = time.monotonic() + settings.STORE_CACHE_LOCK_TIMEOUT
+        while not cache.add(QUEUE_LOCK_KEY, 1,
+                            timeout=settings.STORE_CACHE_LOCK_TIMEOUT):
+            if not wait or time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def drain(self) -> int:
+        head, tail, entries = read_queue()
+        deadline = time.monotonic() + SLOT_WAIT
+        by_user = {}
+        for slot in range(head + 1, tail + 1):
+            entry = entries.get(slot)
+            while entry is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+                entry = cache.get(slot_key(slot))
+            if entry is None:
+                # Expired, or its writer died between incr() and set()
+                continue
+            user_id, book_id, fields = entry
+            by_user.setdefault(user_id, {}).setdefault(
+                book_id, {}).update(fields)
+
+        # A failure leaves the queue as it is, writing toggles again later
+        # is harmless
+        for user_id, user_changes in by_user.items():
+            try:
+                bulk_upsert_relations(User(pk=user_id), user_changes)
+            except IntegrityError:
+                # The user or one of the books is gone, retrying won't help
+                logger.exception(
+                    'Dropped buffered relation changes of user %s', user_id)
+
+        cache.set(QUEUE_HEAD_KEY, tail, timeout=None)
+        cache.delete_many(
+            [slot_key(slot) for slot in range(head + 1, tail + 1)])
+        return sum(map(len, by_user.values()))
+
+
+relation_buffer = RelationBuffer()